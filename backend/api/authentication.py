@@ -0,0 +1,75 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from .utils import TOKEN_CACHE_KEY, TOKEN_CACHE_TIMEOUT
+
+
+def get_token_cache_key(key):
+    """Возвращает ключ токена в кэше.
+
+    В кэше хранится хэш токена, а не сам токен.
+
+    Args:
+        key (str): токен.
+
+    Returns:
+        str: ключ кэша.
+    """
+
+    return TOKEN_CACHE_KEY.format(
+        digest=hashlib.sha256(key.encode()).hexdigest()
+    )
+
+
+def invalidate_tokens(keys):
+    """Удаляет токены из кэша.
+
+    Вызывается при удалении токена (выход из аккаунта) и изменении
+    пользователя (смена пароля, деактивация).
+
+    Args:
+        keys (list): список токенов.
+    """
+
+    keys = list(keys)
+    if settings.TOKEN_SHARED_CACHE and keys:
+        cache.delete_many([get_token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Авторизация по токену с кэшированием токена и пользователя.
+
+    Если включен settings.TOKEN_SHARED_CACHE, токен ищется сначала в кэше
+    CACHES и только потом в базе. Кэш должен быть общим для всех воркеров:
+    удаленный токен или измененный пользователь удаляются из него сразу
+    (см. api.signals), поэтому ни один воркер не использует их после
+    этого. Своего кэша в памяти у воркера нет - его нельзя было бы
+    очистить из другого воркера. Кэшируются только токены активных
+    пользователей, ошибки авторизации не кэшируются.
+    """
+
+    def authenticate_credentials(self, key):
+        """Возвращает пользователя и токен.
+
+        Args:
+            key (str): токен из заголовка Authorization.
+
+        Raises:
+            AuthenticationFailed: ошибка если токен не найден или
+            пользователь неактивен.
+
+        Returns:
+            tuple: пользователь и объект токена.
+        """
+
+        if not settings.TOKEN_SHARED_CACHE:
+            return super().authenticate_credentials(key)
+        cache_key = get_token_cache_key(key)
+        token = cache.get(cache_key)
+        if token is None:
+            _, token = super().authenticate_credentials(key)
+            cache.set(cache_key, token, TOKEN_CACHE_TIMEOUT)
+        return token.user, token
@@ -0,0 +1,332 @@
+import tempfile
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from recipes.models import (COLOR_CHOICES, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag)
+from recipes.search import update_search_index
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Subscribe, User
+
+from .querystats import QueryCollector
+
+# Размеры данных, на которых проверяется бюджет: количество авторов,
+# рецептов у автора, ингредиентов в рецепте и размер страницы.
+BUDGET_SIZES = (2, 20)
+BUDGET_PASSWORD = 'budget-password'
+BUDGET_IMAGE = 'recipes/budget.jpg'
+BUDGET_UPLOAD = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAAD'
+    'UlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+BUDGET_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'query-budgets',
+    }
+}
+READER = 'reader'
+ANONYMOUS = 'anonymous'
+
+
+class QueryBudget(namedtuple(
+    'QueryBudget', ('name', 'method', 'url', 'budget', 'client', 'data'),
+    defaults=(READER, None)
+)):
+    """Бюджет запросов к базе для одного обращения к API.
+
+    Attributes:
+        name (str): название проверки.
+        method (str): метод запроса ('get', 'post', 'patch', 'delete').
+        url (str): шаблон адреса, в который подставляются значения из
+        create_budget_data (например, {size} и {recipe}).
+        budget (int): максимальное количество запросов.
+        client (str): READER (авторизованный пользователь) или ANONYMOUS.
+        data (str): ключ тела запроса из create_budget_data или None.
+    """
+
+    __slots__ = ()
+
+
+# Проверки выполняются по порядку: POST и DELETE для одного объекта идут
+# парами, чтобы каждая проверка начиналась с одинакового состояния.
+# Бюджеты записей рецептов учитывают UPDATE версий справочников, который
+# выполняется после фиксации транзакции (CatalogueBumps) и поэтому не
+# попадает в измерение: данные проверки откатываются.
+QUERY_BUDGETS = (
+    QueryBudget('recipe list', 'get', '/api/recipes/?limit={size}', 6),
+    QueryBudget(
+        'recipe list (anonymous)', 'get', '/api/recipes/?limit={size}', 6,
+        ANONYMOUS
+    ),
+    QueryBudget(
+        'recipe list by cursor', 'get', '/api/recipes/?cursor=&limit={size}',
+        5
+    ),
+    QueryBudget(
+        'recipe list by tags', 'get',
+        '/api/recipes/?limit={size}&tags={tag_slug}&tags={other_tag_slug}', 7
+    ),
+    QueryBudget(
+        'favorite recipes', 'get', '/api/recipes/?limit={size}&is_favorited=1',
+        6
+    ),
+    QueryBudget(
+        'recipes in shopping cart', 'get',
+        '/api/recipes/?limit={size}&is_in_shopping_cart=1', 6
+    ),
+    QueryBudget(
+        'recipe search', 'get', '/api/recipes/?limit={size}&search=борщ', 6
+    ),
+    QueryBudget('recipe detail', 'get', '/api/recipes/{recipe}/', 5),
+    QueryBudget(
+        'recipe detail (anonymous)', 'get', '/api/recipes/{recipe}/', 5,
+        ANONYMOUS
+    ),
+    QueryBudget('recipe create', 'post', '/api/recipes/', 27, data='recipe'),
+    QueryBudget(
+        'recipe update', 'patch', '/api/recipes/{own_recipe}/', 26,
+        data='recipe'
+    ),
+    QueryBudget('favorite add', 'post', '/api/recipes/{recipe}/favorite/', 10),
+    QueryBudget(
+        'favorite remove', 'delete', '/api/recipes/{recipe}/favorite/', 9
+    ),
+    QueryBudget(
+        'shopping cart add', 'post', '/api/recipes/{recipe}/shopping_cart/',
+        14
+    ),
+    QueryBudget(
+        'shopping cart remove', 'delete',
+        '/api/recipes/{recipe}/shopping_cart/', 12
+    ),
+    QueryBudget(
+        'shopping cart download', 'get',
+        '/api/recipes/download_shopping_cart/', 2
+    ),
+    QueryBudget(
+        'shopping cart download (csv)', 'get',
+        '/api/recipes/download_shopping_cart/?format=csv', 2
+    ),
+    QueryBudget(
+        'recipe delete', 'delete', '/api/recipes/{own_recipe}/', 13
+    ),
+    QueryBudget(
+        'subscriptions', 'get',
+        '/api/users/subscriptions/?limit={size}&recipes_limit={size}', 6
+    ),
+    QueryBudget(
+        'subscribe', 'post', '/api/users/{author}/subscribe/', 11
+    ),
+    QueryBudget(
+        'unsubscribe', 'delete', '/api/users/{author}/subscribe/', 5
+    ),
+    QueryBudget('user list', 'get', '/api/users/?limit={size}', 4),
+    QueryBudget(
+        'user list (anonymous)', 'get', '/api/users/?limit={size}', 2,
+        ANONYMOUS
+    ),
+    QueryBudget('user detail', 'get', '/api/users/{author}/', 3),
+    QueryBudget('current user', 'get', '/api/users/me/', 2),
+    QueryBudget('tag list', 'get', '/api/tags/', 3),
+    QueryBudget('tag detail', 'get', '/api/tags/{tag}/', 3),
+    QueryBudget('ingredient list', 'get', '/api/ingredients/?name=а', 3),
+    QueryBudget(
+        'ingredient detail', 'get', '/api/ingredients/{ingredient}/', 3
+    ),
+)
+
+
+def get_duplicate_report(collector):
+    """Группирует выполненные запросы по отпечатку.
+
+    Args:
+        collector (QueryCollector): запросы обращения.
+
+    Returns:
+        list: пары (количество, отпечаток) по убыванию количества.
+    """
+
+    return sorted(
+        ((len(durations), sql)
+         for sql, durations in collector.queries.items()),
+        key=lambda item: item[0], reverse=True
+    )
+
+
+def count_queries(collector):
+    """Возвращает количество запросов, собранных QueryCollector.
+
+    Args:
+        collector (QueryCollector): запросы обращения.
+
+    Returns:
+        int: количество запросов.
+    """
+
+    return sum(len(durations) for durations in collector.queries.values())
+
+
+def get_budget_errors(budget, small, large):
+    """Проверяет результаты одной проверки на двух размерах данных.
+
+    Args:
+        budget (QueryBudget): проверка.
+        small (tuple): код ответа и количество запросов на малых данных.
+        large (tuple): код ответа и количество запросов на больших данных.
+
+    Returns:
+        list: описания нарушений (пустой, если проверка пройдена).
+    """
+
+    (small_status, small_count), (large_status, large_count) = small, large
+    errors = []
+    if not small_count or not large_count:
+        errors.append('no queries captured')
+    if max(small_count, large_count) > budget.budget:
+        errors.append(f'over budget {budget.budget}')
+    if large_count > small_count:
+        errors.append('grows with data size')
+    if small_status >= 400 or large_status >= 400:
+        errors.append(f'status {small_status}/{large_status}')
+    return errors
+
+
+def create_budget_data(size):
+    """Создает данные для проверки бюджетов одного размера.
+
+    Создаются size авторов по size рецептов с size ингредиентами. Читатель
+    подписан на всех авторов, кроме {author}, и добавил в избранное и
+    список покупок все рецепты, кроме {recipe}. У читателя есть свой
+    рецепт {own_recipe}.
+
+    Args:
+        size (int): размер данных.
+
+    Returns:
+        dict: значения для адресов проверок, читатель (READER) и тела
+        запросов.
+    """
+
+    used_colors = set(Tag.objects.values_list('color', flat=True))
+    tags = list(Tag.objects.order_by('id')[:2])
+    for color, _ in COLOR_CHOICES:
+        if len(tags) == 2:
+            break
+        if color not in used_colors:
+            tags.append(Tag.objects.create(
+                name=f'budget {color}', slug=f'budget-{len(tags)}',
+                color=color
+            ))
+    ingredients = [
+        Ingredient.objects.create(
+            name=f'budget {number}', measurement_unit='г'
+        ) for number in range(size)
+    ]
+    reader = User.objects.create_user(
+        username='budget_reader', email='budget_reader@example.com',
+        first_name='budget', last_name='reader', password=BUDGET_PASSWORD
+    )
+    authors = [
+        User.objects.create(
+            username=f'budget_author_{number}',
+            email=f'budget_author_{number}@example.com',
+            first_name='budget', last_name='author'
+        ) for number in range(size)
+    ]
+    recipes = []
+    for author in [reader] + authors:
+        for number in range(1 if author == reader else size):
+            recipe = Recipe.objects.create(
+                author=author, name=f'борщ {author.id} {number}',
+                text='budget', image=BUDGET_IMAGE, cooking_time=10
+            )
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=1)
+                for ingredient in ingredients
+            )
+            recipes.append(recipe)
+    update_search_index(recipe.id for recipe in recipes)
+    own_recipe, free_recipe = recipes[0], recipes[1]
+    for recipe in recipes[2:]:
+        Favorite.objects.create(user=reader, recipe=recipe)
+        ShoppingCart.objects.create(user=reader, recipe=recipe)
+    for author in authors[1:]:
+        Subscribe.objects.create(user=reader, author=author)
+    return {
+        'size': size,
+        'tag': tags[0].id,
+        'tag_slug': tags[0].slug,
+        'other_tag_slug': tags[1].slug,
+        'ingredient': ingredients[0].id,
+        'author': authors[0].id,
+        'recipe': free_recipe.id,
+        'own_recipe': own_recipe.id,
+        READER: reader,
+        'recipe_data': {
+            'name': 'budget recipe',
+            'text': 'budget',
+            'cooking_time': 5,
+            'image': BUDGET_UPLOAD,
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 2}
+                for ingredient in ingredients
+            ],
+        },
+    }
+
+
+def measure_budgets(size, budgets=QUERY_BUDGETS):
+    """Выполняет проверки на данных одного размера и откатывает изменения.
+
+    Перед каждым обращением очищаются кэши (ответов, версий справочников,
+    токенов), поэтому считается количество запросов без кэша. Запросы
+    считаются через connection.execute_wrapper(), а не по
+    connection.queries: его длина ограничена, и на больших данных
+    создание данных вытесняет из него все запросы проверки.
+
+    Данные создаются в базе из DATABASES (в транзакции, которая
+    откатывается), поэтому команда check_query_budgets без DEBUG требует
+    --allow-live-db.
+
+    Args:
+        size (int): размер данных.
+        budgets (tuple, опционально): проверки. По умолчанию QUERY_BUDGETS.
+
+    Returns:
+        dict: словарь {название проверки: (код ответа, QueryCollector)}.
+    """
+
+    results = {}
+    with tempfile.TemporaryDirectory() as media_root, override_settings(
+        CACHES=BUDGET_CACHES, MEDIA_ROOT=media_root, ALLOWED_HOSTS=['*']
+    ), transaction.atomic():
+        context = create_budget_data(size)
+        clients = {ANONYMOUS: APIClient(), READER: APIClient()}
+        clients[READER].credentials(
+            HTTP_AUTHORIZATION=(
+                f'Token {Token.objects.create(user=context[READER]).key}'
+            )
+        )
+        for budget in budgets:
+            cache.clear()
+            data = context[f'{budget.data}_data'] if budget.data else None
+            collector = QueryCollector(
+                settings.QUERY_STATS_N_PLUS_ONE_THRESHOLD
+            )
+            with connection.execute_wrapper(collector):
+                response = getattr(clients[budget.client], budget.method)(
+                    budget.url.format(**context), data, format='json'
+                )
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            results[budget.name] = (response.status_code, collector)
+        transaction.set_rollback(True)
+    return results
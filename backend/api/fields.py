@@ -0,0 +1,29 @@
+from django.core.files.uploadedfile import UploadedFile
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from recipes.images import get_image_file_name, prepare_recipe_image
+from rest_framework import serializers
+
+INVALID_IMAGE_MESSAGE = 'Загрузите корректное изображение.'
+
+
+class RecipeImageField(Base64ImageField):
+    """Поле картинки рецепта.
+
+    Принимает картинку строкой base64 (JSON) или файлом (multipart, см.
+    MultiPartJSONParser). Слишком большие картинки уменьшаются при загрузке
+    (см. prepare_recipe_image).
+    """
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, UploadedFile):
+                data.name = get_image_file_name(data)
+                image = serializers.ImageField.to_internal_value(self, data)
+            else:
+                image = super().to_internal_value(data)
+            if image is None:
+                return image
+            return prepare_recipe_image(image)
+        except (OSError, Image.DecompressionBombError):
+            raise serializers.ValidationError(INVALID_IMAGE_MESSAGE)
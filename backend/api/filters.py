@@ -1,19 +1,8 @@
+from django.db.models import F
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Ingredient, Recipe, Tag
-
-
-class IngredientSearchFilter(FilterSet):
-    """Фильтрует ингредиенты при их поиске при создании рецепта.
-
-    Для корректной работы поиска необходимо использовать кириллицу.
-    Название ингредиента должно начинаться с набранных символов.
-    """
-
-    name = filters.CharFilter(field_name="name", lookup_expr='istartswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name', )
+from recipes.models import Recipe, Tag, get_tag_bit
+from recipes.search import search_recipes
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
 
 
 class RecipeFilter(FilterSet):
@@ -23,6 +12,7 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug',
         queryset=Tag.objects.all(),
         to_field_name='slug',
+        method='get_tags'
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited',
@@ -37,6 +27,30 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
 
+    def get_tags(self, queryset, name, value):
+        """Возвращает список рецептов с любым из выбранных тегов.
+
+        Проверяет битовую маску тегов рецепта (Recipe.tags_mask) без
+        соединения с таблицей тегов и DISTINCT. Если id какого-то тега не
+        помещается в маску, фильтрует через таблицу связей.
+
+        Args:
+            queryset (QuerySet): Список обьектов.
+            name : Не используется.
+            value (list): Выбранные теги.
+
+        Returns:
+            QuerySet: Список рецептов с выбранными тегами.
+        """
+        if not value:
+            return queryset
+        bits = [get_tag_bit(tag.id) for tag in value]
+        if not all(bits):
+            return queryset.filter(tags__in=value).distinct()
+        return queryset.annotate(
+            tags_match=F('tags_mask').bitand(sum(bits))
+        ).filter(tags_match__gt=0)
+
     def get_is_favorited(self, queryset, name, value):
         """Возвращает список рецептов на авторов которых подписан пользователь.
 
@@ -68,3 +82,24 @@ class RecipeFilter(FilterSet):
         if value:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск рецептов по параметру search.
+
+    Ищет по названию, тексту и названиям ингредиентов (см.
+    recipes.search). Найденные рецепты упорядочиваются по релевантности,
+    если в запросе не указан параметр ordering. При разбивке на страницы по
+    курсору рецепты упорядочиваются по дате публикации.
+    """
+
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        queryset = search_recipes(queryset, query)
+        if OrderingFilter.ordering_param in request.query_params:
+            return queryset
+        return queryset.order_by('-rank', '-pub_date', '-id')
@@ -0,0 +1,161 @@
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+# Эндпоинты чтения, которые обслуживает пул чтений foodgram.asgi.
+BENCHMARK_PATHS = (
+    '/api/recipes/', '/api/recipes/?limit=20', '/api/tags/',
+    '/api/ingredients/?name=а',
+)
+RECIPE_PATH = '/api/recipes/{id}/'
+SHOPPING_LIST_PATH = '/api/recipes/download_shopping_cart/'
+TOTAL = 'total'
+
+
+def get_percentile(latencies, percentile):
+    """Возвращает перцентиль отсортированного списка.
+
+    Args:
+        latencies (list): отсортированное время ответов (секунды).
+        percentile (float): перцентиль от 0 до 1.
+
+    Returns:
+        float: значение перцентиля.
+    """
+
+    return latencies[min(int(len(latencies) * percentile), len(latencies) - 1)]
+
+
+def get_rss(pid):
+    """Возвращает память процесса и всех его потомков (только Linux).
+
+    Args:
+        pid (int): id процесса, например мастера gunicorn.
+
+    Returns:
+        int: сумма RSS в килобайтах.
+    """
+
+    with open(f'/proc/{pid}/status') as file:
+        rss = next(
+            (int(line.split()[1]) for line in file
+             if line.startswith('VmRSS:')), 0
+        )
+    children_path = f'/proc/{pid}/task/{pid}/children'
+    if os.path.exists(children_path):
+        with open(children_path) as file:
+            rss += sum(get_rss(int(child)) for child in file.read().split())
+    return rss
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a running server with concurrent read requests and print '
+        'throughput and latency percentiles, to compare the WSGI and ASGI '
+        '(foodgram.asgi) deployments at equal memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'url', nargs='?', default='http://127.0.0.1:8000',
+            help='Server address'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=32,
+            help='Number of concurrent clients'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Test duration in seconds'
+        )
+        parser.add_argument(
+            '--token',
+            help='Authorization token; enables the shopping list download'
+        )
+        parser.add_argument(
+            '--recipes', type=int, nargs='*', default=(),
+            help='Ids of recipes whose detail pages are requested'
+        )
+        parser.add_argument(
+            '--pids', type=int, nargs='*', default=(),
+            help='Server processes (with children) whose memory is reported'
+        )
+
+    def handle(self, *args, **options):
+        paths = list(BENCHMARK_PATHS) + [
+            RECIPE_PATH.format(id=recipe) for recipe in options['recipes']
+        ]
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+            paths.append(SHOPPING_LIST_PATH)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+        started = time.monotonic()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            for future in [
+                executor.submit(
+                    self.run_client, options['url'],
+                    paths[number % len(paths):] + paths[:number % len(paths)],
+                    headers, deadline
+                ) for number in range(options['concurrency'])
+            ]:
+                future.result()
+        elapsed = time.monotonic() - started
+        self.latencies[TOTAL] = [
+            latency for path in paths for latency in self.latencies[path]
+        ]
+        if not self.latencies[TOTAL]:
+            raise CommandError('No requests were made')
+        self.errors[TOTAL] = sum(self.errors.values())
+        self.stdout.write(
+            f'{"requests":>9} {"errors":>7} {"req/s":>8} {"p50 ms":>8} '
+            f'{"p99 ms":>8}  path'
+        )
+        for path in paths + [TOTAL]:
+            latencies = sorted(self.latencies[path])
+            if not latencies:
+                continue
+            self.stdout.write(
+                f'{len(latencies):9} {self.errors[path]:7} '
+                f'{len(latencies) / elapsed:8.1f} '
+                f'{get_percentile(latencies, 0.5) * 1000:8.1f} '
+                f'{get_percentile(latencies, 0.99) * 1000:8.1f}  {path}'
+            )
+        for pid in options['pids']:
+            self.stdout.write(
+                f'Memory of process {pid}: {get_rss(pid) / 1024:.1f} MB'
+            )
+
+    def run_client(self, url, paths, headers, deadline):
+        """Отправляет запросы по кругу до окончания теста.
+
+        Args:
+            url (str): адрес сервера.
+            paths (list): адреса запросов.
+            headers (dict): заголовки запросов.
+            deadline (float): время окончания теста (time.monotonic()).
+        """
+
+        session = requests.Session()
+        session.headers.update(headers)
+        for path in itertools.cycle(paths):
+            if time.monotonic() >= deadline:
+                return
+            started = time.perf_counter()
+            try:
+                ok = session.get(url + path).ok
+            except requests.RequestException:
+                ok = False
+            duration = time.perf_counter() - started
+            with self.lock:
+                self.latencies[path].append(duration)
+                self.errors[path] += not ok
@@ -0,0 +1,79 @@
+from api.budgets import (BUDGET_SIZES, QUERY_BUDGETS, count_queries,
+                         get_budget_errors, get_duplicate_report,
+                         measure_budgets)
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Сколько самых частых запросов выводить для проверки, превысившей бюджет.
+REPORT_QUERIES = 10
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that every API endpoint stays within its SQL query budget '
+        'and that the number of queries does not grow with the data size'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*',
+            help='Names of the checks to run (by default all of them)'
+        )
+        parser.add_argument(
+            '--sizes', type=int, nargs=2, default=BUDGET_SIZES,
+            metavar=('SMALL', 'LARGE'),
+            help='Data sizes the checks are run on'
+        )
+        parser.add_argument(
+            '--verbose-sql', action='store_true',
+            help='Print the queries of every check, not only failed ones'
+        )
+        parser.add_argument(
+            '--allow-live-db', action='store_true',
+            help=(
+                'Run with DEBUG off: the checks create data in the database '
+                'from DATABASES (and roll it back)'
+            )
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['allow_live_db']:
+            raise CommandError(
+                'The checks create data in the database from DATABASES. Run '
+                'them with DEBUG on or pass --allow-live-db'
+            )
+        budgets = [
+            budget for budget in QUERY_BUDGETS
+            if not options['names'] or budget.name in options['names']
+        ]
+        if not budgets:
+            raise CommandError('No checks with these names')
+        small, large = options['sizes']
+        results = {
+            size: measure_budgets(size, budgets) for size in (small, large)
+        }
+        failed = 0
+        for budget in budgets:
+            (small_status, small_queries), (large_status, large_queries) = (
+                results[small][budget.name], results[large][budget.name]
+            )
+            small_count = count_queries(small_queries)
+            large_count = count_queries(large_queries)
+            errors = get_budget_errors(
+                budget, (small_status, small_count),
+                (large_status, large_count)
+            )
+            self.stdout.write(
+                f'{"FAIL" if errors else "ok":4} {budget.name:32} '
+                f'{small_count:3} / {large_count:3} '
+                f'(budget {budget.budget}) {", ".join(errors)}'
+            )
+            if errors or options['verbose_sql']:
+                for count, sql in get_duplicate_report(
+                    large_queries
+                )[:REPORT_QUERIES]:
+                    self.stdout.write(f'     {count:4} x {sql}')
+            failed += bool(errors)
+        if failed:
+            raise CommandError(f'Query budget checks failed: {failed}')
+        self.stdout.write(f'Query budget checks passed: {len(budgets)}')
@@ -0,0 +1,90 @@
+import os
+from collections import defaultdict
+
+from api.querystats import FingerprintStats, load_query_stats
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Сколько символов запроса выводить без --full-sql.
+SQL_PREVIEW_LENGTH = 160
+SORT_KEYS = {
+    'duration': lambda stats: stats.duration,
+    'count': lambda stats: stats.count,
+    'n_plus_one': lambda stats: stats.n_plus_one,
+}
+ALL_ROUTES = '*'
+
+
+class Command(BaseCommand):
+    help = (
+        'Print the SQL query shapes that take the most time, collected by '
+        'QueryStatsMiddleware from all workers, and flag probable N+1 '
+        'queries'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=20,
+            help='Number of query shapes to print'
+        )
+        parser.add_argument(
+            '--sort', choices=SORT_KEYS, default='duration',
+            help='Order of the query shapes'
+        )
+        parser.add_argument(
+            '--by-view', action='store_true',
+            help='Rank query shapes per view instead of across all views'
+        )
+        parser.add_argument(
+            '--full-sql', action='store_true',
+            help='Print whole queries instead of their beginning'
+        )
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Delete the collected statistics'
+        )
+
+    def handle(self, *args, **options):
+        directory = settings.QUERY_STATS_DIR
+        if options['reset']:
+            deleted = 0
+            if os.path.isdir(directory):
+                for entry in os.scandir(directory):
+                    if entry.name.endswith('.json'):
+                        os.remove(entry.path)
+                        deleted += 1
+            self.stdout.write(f'Deleted statistics files: {deleted}')
+            return
+        fingerprints = load_query_stats(directory)
+        if not options['by_view']:
+            merged = defaultdict(FingerprintStats)
+            for (_, fingerprint), stats in fingerprints.items():
+                merged[ALL_ROUTES, fingerprint].merge(stats)
+            fingerprints = merged
+        if not fingerprints:
+            self.stdout.write(f'No statistics in {directory}')
+            return
+        ranked = sorted(
+            fingerprints.items(),
+            key=lambda item: SORT_KEYS[options['sort']](item[1]),
+            reverse=True
+        )
+        self.stdout.write(
+            f'{"count":>9} {"total ms":>10} {"p95 ms":>7} {"per req":>7} '
+            f'{"N+1":>5}  view / query'
+        )
+        for (route, fingerprint), stats in ranked[:options['top']]:
+            p95 = stats.get_percentile(0.95)
+            sql = fingerprint if options['full_sql'] else (
+                fingerprint[:SQL_PREVIEW_LENGTH]
+            )
+            self.stdout.write(
+                f'{stats.count:9} {stats.duration * 1000:10.1f} '
+                f'{p95 * 1000 if p95 is not None else float("inf"):7.1f} '
+                f'{stats.count / stats.requests:7.1f} {stats.n_plus_one:5}  '
+                f'{route}: {sql}'
+            )
+            for source, count in stats.sources.most_common():
+                self.stdout.write(
+                    f'{"":42}N+1 x{count} from {source or "unknown"}'
+                )
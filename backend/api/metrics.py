@@ -0,0 +1,135 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+# Границы корзин гистограммы времени ответа (секунды).
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+METRICS_PREFIX = 'foodgram'
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+UNRESOLVED_ROUTE = 'unresolved'
+
+
+class QueryTimer:
+    """Считает количество и время SQL-запросов.
+
+    Подключается к соединению через connection.execute_wrapper().
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class RouteStats:
+    """Накопленная статистика одного маршрута."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.query_duration = 0.0
+        self.response_bytes = 0
+        self.statuses = defaultdict(int)
+
+
+class RequestMetrics:
+    """Метрики запросов в памяти процесса.
+
+    Для каждого маршрута (view_name, например recipe-list) хранит
+    гистограмму времени ответа, количество и время SQL-запросов, размер
+    ответов и количество ответов по кодам. У каждого воркера свои метрики.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = defaultdict(RouteStats)
+
+    def observe(self, route, status, duration, queries, query_duration,
+                response_bytes):
+        """Добавляет в метрики один запрос.
+
+        Args:
+            route (str): название маршрута.
+            status (int): код ответа.
+            duration (float): время ответа (секунды).
+            queries (int): количество SQL-запросов.
+            query_duration (float): время SQL-запросов (секунды).
+            response_bytes (int): размер ответа (байты).
+        """
+
+        bucket = bisect_left(LATENCY_BUCKETS, duration)
+        with self.lock:
+            stats = self.routes[route]
+            stats.buckets[bucket] += 1
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += queries
+            stats.query_duration += query_duration
+            stats.response_bytes += response_bytes
+            stats.statuses[status] += 1
+
+    def render(self):
+        """Возвращает метрики в текстовом формате Prometheus.
+
+        Returns:
+            str: метрики.
+        """
+
+        with self.lock:
+            routes = sorted(
+                (route, stats.__dict__.copy(), dict(stats.statuses))
+                for route, stats in self.routes.items()
+            )
+        name = f'{METRICS_PREFIX}_request_duration_seconds'
+        lines = [
+            f'# HELP {name} Request wall time.',
+            f'# TYPE {name} histogram',
+        ]
+        for route, stats, _ in routes:
+            total = 0
+            for bound, count in zip(
+                (*LATENCY_BUCKETS, '+Inf'), stats['buckets']
+            ):
+                total += count
+                lines.append(
+                    f'{name}_bucket{{route="{route}",le="{bound}"}} {total}'
+                )
+            lines.append(f'{name}_sum{{route="{route}"}} {stats["duration"]}')
+            lines.append(f'{name}_count{{route="{route}"}} {stats["count"]}')
+        for metric, key, description in (
+            ('sql_queries_total', 'queries', 'SQL queries.'),
+            ('sql_duration_seconds_total', 'query_duration',
+             'SQL query time.'),
+            ('response_bytes_total', 'response_bytes', 'Response size.'),
+        ):
+            name = f'{METRICS_PREFIX}_{metric}'
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(
+                f'{name}{{route="{route}"}} {stats[key]}'
+                for route, stats, _ in routes
+            )
+        name = f'{METRICS_PREFIX}_responses_total'
+        lines.append(f'# HELP {name} Responses by status code.')
+        lines.append(f'# TYPE {name} counter')
+        lines.extend(
+            f'{name}{{route="{route}",status="{status}"}} {count}'
+            for route, _, statuses in routes
+            for status, count in sorted(statuses.items())
+        )
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
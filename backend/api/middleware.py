@@ -0,0 +1,209 @@
+import atexit
+import itertools
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse
+
+from .metrics import UNRESOLVED_ROUTE, QueryTimer, request_metrics
+from .profiling import (PROFILE_CONTENT_TYPE, PROFILE_HEADER,
+                        PROFILE_ID_HEADER, PROFILE_MEMORY_PARAM, PROFILE_PARAM,
+                        PROFILE_RETURN_PARAM, RequestProfile,
+                        is_profile_token_valid, profile_lock)
+from .querystats import QueryCollector, query_stats
+
+
+def get_route(request):
+    """Возвращает название маршрута запроса (view_name, например
+    recipe-list) или UNRESOLVED_ROUTE.
+
+    Args:
+        request (HttpRequest): объект запроса.
+
+    Returns:
+        str: название маршрута.
+    """
+
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else UNRESOLVED_ROUTE
+
+
+class RequestMetricsMiddleware:
+    """Собирает метрики каждого запроса (см. api.metrics).
+
+    Для маршрута запроса записывает время ответа, количество и время
+    SQL-запросов и размер ответа, а в ответ добавляет заголовок
+    Server-Timing (app - время ответа, db - время SQL-запросов). Размер
+    потокового ответа известен только после его отправки, поэтому такие
+    запросы записываются в метрики по окончании потока.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        route = get_route(request)
+        response['Server-Timing'] = (
+            f'app;dur={duration * 1000:.1f}, '
+            f'db;dur={timer.duration * 1000:.1f};desc="{timer.count} queries"'
+        )
+        if response.streaming:
+            response.streaming_content = self.observe_stream(
+                response.streaming_content, route, response.status_code,
+                started, timer
+            )
+        else:
+            request_metrics.observe(
+                route, response.status_code, duration, timer.count,
+                timer.duration, len(response.content)
+            )
+        return response
+
+    def observe_stream(self, content, route, status, started, timer):
+        """Передает потоковый ответ и записывает метрики по его окончании.
+
+        SQL-запросы, выполненные во время отправки потока, тоже
+        учитываются.
+
+        Args:
+            content (iterator): части ответа.
+            route (str): название маршрута.
+            status (int): код ответа.
+            started (float): время начала запроса (time.perf_counter()).
+            timer (QueryTimer): счетчик SQL-запросов запроса.
+
+        Yields:
+            bytes: части ответа.
+        """
+
+        response_bytes = 0
+        try:
+            with connection.execute_wrapper(timer):
+                for chunk in content:
+                    response_bytes += len(chunk)
+                    yield chunk
+        finally:
+            request_metrics.observe(
+                route, status, time.perf_counter() - started, timer.count,
+                timer.duration, response_bytes
+            )
+
+
+class ProfilingMiddleware:
+    """Профилирует запросы по требованию (см. api.profiling).
+
+    Запрос профилируется, если в заголовке X-Profile или параметре profile
+    передан действующий токен суперпользователя, либо автоматически каждый
+    settings.PROFILE_SAMPLE_RATE-й запрос (0 - выключено). С параметром
+    profile_memory дополнительно отслеживаются выделения памяти. С
+    параметром profile_return вместо ответа возвращается отчет, иначе
+    профиль сохраняется в settings.PROFILE_DIR, а его id передается в
+    заголовке X-Profile-Id. Пока профилируется один запрос, остальные
+    выполняются без профилирования.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.counter = itertools.count(1)
+
+    def __call__(self, request):
+        token = request.META.get(PROFILE_HEADER) or request.GET.get(
+            PROFILE_PARAM
+        )
+        requested = bool(token) and is_profile_token_valid(token)
+        sample_rate = settings.PROFILE_SAMPLE_RATE
+        sampled = sample_rate > 0 and next(self.counter) % sample_rate == 0
+        if not (requested or sampled) or not profile_lock.acquire(
+            blocking=False
+        ):
+            return self.get_response(request)
+        try:
+            return self.profile(request, requested)
+        finally:
+            profile_lock.release()
+
+    def profile(self, request, requested):
+        """Выполняет запрос под профилировщиком.
+
+        Профилируется обработка запроса до возврата ответа. Потоковый ответ
+        (например, выгрузка списка покупок) передается клиенту как есть:
+        его отправка в профиль не попадает, и он не собирается в памяти.
+
+        Args:
+            request (HttpRequest): объект запроса.
+            requested (bool): профилирование запрошено токеном (иначе
+            запрос выбран автоматически и профиль только сохраняется).
+
+        Returns:
+            HttpResponse: ответ или отчет профилирования.
+        """
+
+        memory = requested and PROFILE_MEMORY_PARAM in request.GET
+        with RequestProfile(memory=memory) as profile:
+            response = self.get_response(request)
+        title = (
+            f'{request.method} {request.get_full_path()} '
+            f'{response.status_code}'
+        )
+        if response.streaming:
+            title += ' (streaming, sending is not profiled)'
+        if requested and PROFILE_RETURN_PARAM in request.GET:
+            return HttpResponse(
+                profile.get_report(title), content_type=PROFILE_CONTENT_TYPE
+            )
+        response[PROFILE_ID_HEADER] = profile.save(get_route(request), title)
+        return response
+
+
+class QueryStatsMiddleware:
+    """Собирает статистику отпечатков SQL-запросов по маршрутам (см.
+    api.querystats).
+
+    Включается настройкой QUERY_STATS_ENABLED. Повторение одного отпечатка
+    больше QUERY_STATS_N_PLUS_ONE_THRESHOLD раз за запрос отмечается как
+    вероятная проблема N+1. Статистику выводит команда query_stats.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_STATS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        atexit.register(query_stats.flush)
+
+    def __call__(self, request):
+        collector = QueryCollector(settings.QUERY_STATS_N_PLUS_ONE_THRESHOLD)
+        with connection.execute_wrapper(collector):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.observe_stream(
+                response.streaming_content, get_route(request), collector
+            )
+        else:
+            query_stats.observe(get_route(request), collector)
+        return response
+
+    def observe_stream(self, content, route, collector):
+        """Передает потоковый ответ и записывает статистику по его
+        окончании.
+
+        Args:
+            content (iterator): части ответа.
+            route (str): название маршрута.
+            collector (QueryCollector): запросы обращения.
+
+        Yields:
+            bytes: части ответа.
+        """
+
+        try:
+            with connection.execute_wrapper(collector):
+                yield from content
+        finally:
+            query_stats.observe(route, collector)
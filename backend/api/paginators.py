@@ -1,4 +1,12 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+POSITION_SEPARATOR = '|'
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -9,3 +17,150 @@ class CustomPageNumberPagination(PageNumberPagination):
     """
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Разбивает список рецептов на страницы по ключу (pub_date, id).
+
+    Вместо COUNT(*) и OFFSET каждая страница выбирается условием
+    (pub_date, id) < (pub_date, id) последнего рецепта предыдущей страницы,
+    поэтому глубокие страницы не замедляются, а новые рецепты не сдвигают
+    границы страниц. Курсоры next/previous непрозрачны для клиента.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Возвращает рецепты страницы, на которую указывает курсор.
+
+        Args:
+            queryset (QuerySet): отфильтрованный список рецептов.
+            request (Request): объект запроса.
+            view (APIView, опционально): представление. По умолчанию None.
+
+        Returns:
+            list: список рецептов страницы.
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.get_position(self.cursor)
+        if position is not None:
+            pub_date, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+                )
+        queryset = queryset.order_by(
+            *(('pub_date', 'id') if reverse else self.ordering)
+        )
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def get_position(self, cursor):
+        """Возвращает ключ (pub_date, id) из курсора.
+
+        Args:
+            cursor (Cursor): декодированный курсор или None.
+
+        Raises:
+            NotFound: ошибка если курсор поврежден.
+
+        Returns:
+            tuple: дата публикации и id рецепта или None для первой страницы.
+        """
+        if cursor is None or cursor.position is None:
+            return None
+        pub_date, _, pk = cursor.position.rpartition(POSITION_SEPARATOR)
+        pub_date = parse_datetime(pub_date)
+        if pub_date is None or not pk.isdigit():
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, int(pk)
+
+    def encode_position(self, recipe, reverse):
+        """Возвращает ссылку с курсором, указывающим на рецепт.
+
+        Args:
+            recipe (Recipe): граничный рецепт страницы.
+            reverse (bool): направление перехода (True - назад).
+
+        Returns:
+            str: ссылка на соседнюю страницу.
+        """
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=reverse,
+            position=(f'{recipe.pub_date.isoformat()}'
+                      f'{POSITION_SEPARATOR}{recipe.id}')
+        ))
+
+    def get_next_link(self):
+        """Возвращает ссылку на следующую страницу или None."""
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_position(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        """Возвращает ссылку на предыдущую страницу или None."""
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_position(self.page[0], reverse=True)
+
+
+class RecipePaginator(Paginator):
+    """Paginator для списка рецептов.
+
+    Количество рецептов считается по списку только их id: аннотации
+    (флаги пользователя Exists, tags_match) не попадают в COUNT(*) и не
+    вычисляются для каждого рецепта таблицы.
+    """
+
+    @cached_property
+    def count(self):
+        """Возвращает количество рецептов в списке."""
+        return self.object_list.values('pk').count()
+
+
+class RecipePagination(CustomPageNumberPagination):
+    """Разбивает список рецептов на страницы.
+
+    По умолчанию используется постраничная разбивка (параметр page). Если в
+    запросе передан параметр cursor (для первой страницы - пустой),
+    используется разбивка по курсору RecipeCursorPagination.
+    """
+
+    cursor_query_param = 'cursor'
+    django_paginator_class = RecipePaginator
+
+    def __init__(self):
+        self.cursor_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Разбивает список рецептов на страницы выбранным способом."""
+        if self.cursor_query_param in request.query_params:
+            self.cursor_pagination = RecipeCursorPagination()
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        """Возвращает ответ в формате выбранного способа разбивки."""
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,80 @@
+import json
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParser as DjangoParser
+from django.http.multipartparser import MultiPartParserError
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+from .utils import RECIPE_IMAGE_MAX_SIZE
+
+JSON_PART = 'data'
+
+
+class RequestEntityTooLarge(APIException):
+    """Ошибка: загружаемый файл больше RECIPE_IMAGE_MAX_SIZE."""
+
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = (
+        f'Размер файла не должен превышать '
+        f'{RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} МБ.'
+    )
+    default_code = 'request_entity_too_large'
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Записывает загружаемые файлы во временные файлы на диске по частям
+    и прерывает загрузку, как только файл превышает RECIPE_IMAGE_MAX_SIZE.
+    """
+
+    def handle_raw_input(self, input_data, meta, content_length, boundary,
+                         encoding=None):
+        if content_length > (
+            RECIPE_IMAGE_MAX_SIZE + settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        ):
+            raise RequestEntityTooLarge
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > RECIPE_IMAGE_MAX_SIZE:
+            self.file.close()
+            raise RequestEntityTooLarge
+        return super().receive_data_chunk(raw_data, start)
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """Разбирает multipart/form-data с файлами и данными в JSON.
+
+    Файлы (картинка рецепта) передаются отдельными частями и записываются на
+    диск (LimitedUploadHandler), а не декодируются из base64 в памяти.
+    Остальные данные, включая вложенные списки ингредиентов и тегов,
+    передаются в части JSON_PART в формате JSON. Если такой части нет,
+    используются обычные поля формы.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        try:
+            data, files = DjangoParser(
+                meta, stream, [LimitedUploadHandler(request)], encoding
+            ).parse()
+        except MultiPartParserError as exc:
+            raise ParseError(f'Multipart form parse error - {exc}')
+        if JSON_PART not in data:
+            return DataAndFiles(data, files)
+        try:
+            payload = json.loads(data[JSON_PART])
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+        if not isinstance(payload, dict):
+            raise ParseError(
+                f'JSON parse error - {JSON_PART} must be an object'
+            )
+        # Request дополняет data файлами через dict.update(), который для
+        # MultiValueDict копирует списки значений, а не сами файлы.
+        return DataAndFiles(payload, files.dict())
@@ -24,3 +24,10 @@ class IsAdminOrReadOnly(BasePermission):
 
     def has_permission(self, request, view):
         return request.method in SAFE_METHODS or request.user.is_superuser
+
+
+class IsSuperuser(BasePermission):
+    """Разрешает доступ только суперпользователям."""
+
+    def has_permission(self, request, view):
+        return request.user.is_superuser
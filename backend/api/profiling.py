@@ -0,0 +1,164 @@
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.signing import BadSignature, TimestampSigner
+from users.models import User
+
+PROFILE_SALT = 'api.profiling'
+# Сколько секунд действует токен профилирования.
+PROFILE_TOKEN_MAX_AGE = 3600
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+# Вернуть отчет вместо ответа (иначе отчет сохраняется в PROFILE_DIR).
+PROFILE_RETURN_PARAM = 'profile_return'
+# Дополнительно отследить выделения памяти (tracemalloc).
+PROFILE_MEMORY_PARAM = 'profile_memory'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+PROFILE_TOP = 30
+PROFILE_CONTENT_TYPE = 'text/plain; charset=utf-8'
+
+signer = TimestampSigner(salt=PROFILE_SALT)
+# cProfile и tracemalloc работают на весь процесс, поэтому одновременно
+# профилируется только один запрос.
+profile_lock = threading.Lock()
+# Номер профиля в процессе: профили одной секунды не перезаписывают друг
+# друга.
+profile_numbers = itertools.count(1)
+
+
+def create_profile_token(user):
+    """Возвращает подписанный токен профилирования для пользователя.
+
+    Args:
+        user (User): суперпользователь.
+
+    Returns:
+        str: токен, действующий PROFILE_TOKEN_MAX_AGE секунд.
+    """
+
+    return signer.sign(str(user.pk))
+
+
+def is_profile_token_valid(token):
+    """Проверяет токен профилирования.
+
+    Токен должен быть подписан, не устареть и принадлежать активному
+    суперпользователю.
+
+    Args:
+        token (str): токен из заголовка X-Profile или параметра profile.
+
+    Returns:
+        bool: True если запрос можно профилировать.
+    """
+
+    try:
+        user_id = signer.unsign(token, max_age=PROFILE_TOKEN_MAX_AGE)
+    except BadSignature:
+        return False
+    return User.objects.filter(
+        pk=user_id, is_superuser=True, is_active=True
+    ).exists()
+
+
+class RequestProfile:
+    """Профиль одного запроса: cProfile и (опционально) tracemalloc.
+
+    Используется как контекстный менеджер вокруг обработки запроса.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.profiler = cProfile.Profile()
+        self.snapshot = None
+        self.duration = None
+
+    def __enter__(self):
+        if self.memory:
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+        if self.memory:
+            self.snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+    def get_report(self, title):
+        """Возвращает текстовый отчет: PROFILE_TOP функций по общему
+        времени и мест выделения памяти.
+
+        Args:
+            title (str): заголовок отчета (запрос и код ответа).
+
+        Returns:
+            str: отчет.
+        """
+
+        stream = io.StringIO()
+        stream.write(f'{title}\nTotal: {self.duration * 1000:.1f} ms\n')
+        pstats.Stats(self.profiler, stream=stream).sort_stats(
+            pstats.SortKey.CUMULATIVE
+        ).print_stats(PROFILE_TOP)
+        if self.snapshot is not None:
+            stream.write('Top allocations:\n')
+            for statistic in self.snapshot.statistics('lineno')[:PROFILE_TOP]:
+                stream.write(f'{statistic}\n')
+        return stream.getvalue()
+
+    def save(self, name, title):
+        """Сохраняет профиль (.prof для pstats/snakeviz) и отчет (.txt) в
+        settings.PROFILE_DIR и удаляет самые старые профили сверх
+        settings.PROFILE_MAX_FILES.
+
+        Args:
+            name (str): название профиля (маршрут запроса).
+            title (str): заголовок отчета.
+
+        Returns:
+            str: id профиля (имя файлов без расширения).
+        """
+
+        directory = settings.PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        profile_id = (
+            f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-'
+            f'{next(profile_numbers)}-{name}'
+        )
+        path = os.path.join(directory, profile_id)
+        self.profiler.dump_stats(f'{path}.prof')
+        with open(f'{path}.txt', 'w', encoding='utf-8') as file:
+            file.write(self.get_report(title))
+        rotate_profiles(directory, settings.PROFILE_MAX_FILES)
+        return profile_id
+
+
+def rotate_profiles(directory, max_profiles):
+    """Удаляет самые старые профили, оставляя max_profiles последних.
+
+    Args:
+        directory (str): каталог профилей.
+        max_profiles (int): сколько профилей оставить.
+    """
+
+    profiles = sorted(
+        (entry.stat().st_mtime, entry.path[:-len('.prof')])
+        for entry in os.scandir(directory)
+        if entry.name.endswith('.prof')
+    )
+    for _, path in profiles[:max(len(profiles) - max_profiles, 0)]:
+        for extension in ('.prof', '.txt'):
+            try:
+                os.remove(f'{path}{extension}')
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,291 @@
+import json
+import logging
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from rest_framework.fields import Field
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы времени SQL-запросов (секунды).
+QUERY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0
+)
+# Литералы и плейсхолдеры, которые заменяются на '?', списки значений
+# ('IN (?, ?)', 'VALUES (?, ?), (?, ?)'), которые сворачиваются в '(...)'.
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|%s|\b\d+(?:\.\d+)?\b")
+SQL_LISTS = re.compile(r'\((?:\s*\?\s*,)*\s*\?\s*\)')
+SQL_REPEATED_LISTS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+# Модули, кадры которых пропускаются при поиске места запроса в коде
+# проекта.
+LIBRARY_PATHS = (
+    'site-packages', 'dist-packages', os.path.dirname(os.__file__)
+)
+# Методы полей сериализатора, в которых поле получает и выводит значение.
+FIELD_METHODS = ('get_attribute', 'to_representation')
+QUERY_STATS_FILE = '{host}-{pid}.json'
+
+
+def get_sql_fingerprint(sql):
+    """Возвращает запрос без значений параметров.
+
+    Запросы, отличающиеся только значениями (например, id в N+1) или
+    длиной списков в IN и VALUES, дают один и тот же отпечаток.
+
+    Args:
+        sql (str): текст запроса.
+
+    Returns:
+        str: отпечаток запроса.
+    """
+
+    return SQL_REPEATED_LISTS.sub(
+        '(...)', SQL_LISTS.sub('(...)', SQL_LITERALS.sub('?', sql))
+    )
+
+
+def get_query_source():
+    """Находит, что выполнило запрос: поле сериализатора или строку кода
+    проекта.
+
+    Returns:
+        str: 'Сериализатор.поле', 'файл:строка' или '' если запрос
+        выполнен только библиотечным кодом.
+    """
+
+    location = ''
+    frame = sys._getframe(1)
+    while frame is not None:
+        field = frame.f_locals.get('self')
+        if frame.f_code.co_name in FIELD_METHODS and isinstance(
+            field, Field
+        ) and field.field_name:
+            return f'{type(field.parent).__name__}.{field.field_name}'
+        filename = frame.f_code.co_filename
+        if not location and not filename.startswith(LIBRARY_PATHS) and (
+            filename != __file__
+        ):
+            location = f'{os.path.relpath(filename)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return location
+
+
+class QueryCollector:
+    """Собирает отпечатки SQL-запросов одного запроса к API.
+
+    Подключается к соединению через connection.execute_wrapper(). Когда
+    один отпечаток повторяется больше threshold раз, запоминает, что его
+    выполнило (см. get_query_source) - вероятная проблема N+1.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.queries = defaultdict(list)
+        self.sources = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            fingerprint = get_sql_fingerprint(sql)
+            durations = self.queries[fingerprint]
+            durations.append(time.perf_counter() - started)
+            if len(durations) == self.threshold + 1:
+                self.sources[fingerprint] = get_query_source()
+
+
+class FingerprintStats:
+    """Накопленная статистика одного отпечатка на одном маршруте."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(QUERY_BUCKETS) + 1)
+        self.count = 0
+        self.duration = 0.0
+        self.requests = 0
+        self.n_plus_one = 0
+        self.sources = Counter()
+
+    def add(self, durations, source=None):
+        """Добавляет запросы одного обращения к API.
+
+        Args:
+            durations (list): время каждого запроса (секунды).
+            source (str, опционально): источник N+1, если он найден.
+        """
+
+        for duration in durations:
+            self.buckets[bisect_left(QUERY_BUCKETS, duration)] += 1
+        self.count += len(durations)
+        self.duration += sum(durations)
+        self.requests += 1
+        if source is not None:
+            self.n_plus_one += 1
+            self.sources[source] += 1
+
+    def merge(self, stats):
+        """Добавляет статистику другого маршрута или процесса.
+
+        Args:
+            stats (FingerprintStats): статистика.
+        """
+
+        self.buckets = [
+            total + count for total, count in zip(self.buckets, stats.buckets)
+        ]
+        self.count += stats.count
+        self.duration += stats.duration
+        self.requests += stats.requests
+        self.n_plus_one += stats.n_plus_one
+        self.sources.update(stats.sources)
+
+    def get_percentile(self, percentile):
+        """Оценивает перцентиль времени запроса по гистограмме.
+
+        Args:
+            percentile (float): перцентиль от 0 до 1.
+
+        Returns:
+            float: верхняя граница корзины (секунды) или None для запросов
+            дольше последней границы.
+        """
+
+        total = 0
+        for bound, count in zip(QUERY_BUCKETS, self.buckets):
+            total += count
+            if total >= self.count * percentile:
+                return bound
+        return None
+
+    def to_dict(self):
+        """Возвращает статистику для записи в JSON."""
+
+        return {
+            'buckets': self.buckets,
+            'count': self.count,
+            'duration': self.duration,
+            'requests': self.requests,
+            'n_plus_one': self.n_plus_one,
+            'sources': dict(self.sources),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Создает статистику из словаря to_dict()."""
+
+        stats = cls()
+        stats.buckets = data['buckets']
+        stats.count = data['count']
+        stats.duration = data['duration']
+        stats.requests = data['requests']
+        stats.n_plus_one = data['n_plus_one']
+        stats.sources = Counter(data['sources'])
+        return stats
+
+
+class QueryStats:
+    """Статистика отпечатков SQL-запросов в памяти процесса.
+
+    Для каждой пары (маршрут, отпечаток) хранит FingerprintStats. Раз в
+    settings.QUERY_STATS_FLUSH_INTERVAL секунд (и при завершении процесса)
+    статистика записывается в файл процесса в settings.QUERY_STATS_DIR,
+    откуда ее читает команда query_stats. Если каталог общий для серверов,
+    команда выводит статистику всех серверов.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.fingerprints = defaultdict(FingerprintStats)
+        self.flushed = time.monotonic()
+
+    def observe(self, route, collector):
+        """Добавляет в статистику запросы одного обращения к API.
+
+        Запись в файл занимает поток, который первым заметил, что интервал
+        прошел: время записи обновляется под блокировкой, поэтому
+        остальные потоки ее не повторяют.
+
+        Args:
+            route (str): название маршрута.
+            collector (QueryCollector): запросы обращения.
+        """
+
+        with self.lock:
+            for fingerprint, durations in collector.queries.items():
+                self.fingerprints[route, fingerprint].add(
+                    durations, collector.sources.get(fingerprint)
+                )
+            now = time.monotonic()
+            flush = now - self.flushed > settings.QUERY_STATS_FLUSH_INTERVAL
+            if flush:
+                self.flushed = now
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """Записывает статистику процесса в его файл в
+        settings.QUERY_STATS_DIR.
+
+        Записи выполняются по одной (flush_lock). Ошибка записи только
+        попадает в лог: из-за статистики запрос к API не должен падать.
+        """
+
+        with self.flush_lock:
+            with self.lock:
+                if not self.fingerprints:
+                    return
+                self.flushed = time.monotonic()
+                data = [
+                    [route, fingerprint, stats.to_dict()]
+                    for (route, fingerprint), stats
+                    in self.fingerprints.items()
+                ]
+            path = os.path.join(
+                settings.QUERY_STATS_DIR, QUERY_STATS_FILE.format(
+                    host=socket.gethostname(), pid=os.getpid()
+                )
+            )
+            try:
+                os.makedirs(settings.QUERY_STATS_DIR, exist_ok=True)
+                with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+                    json.dump(data, file, ensure_ascii=False)
+                os.replace(f'{path}.tmp', path)
+            except OSError:
+                logger.exception('Query stats flush to %s failed', path)
+
+
+def load_query_stats(directory):
+    """Читает и объединяет статистику всех процессов из каталога.
+
+    Args:
+        directory (str): каталог со статистикой (settings.QUERY_STATS_DIR).
+
+    Returns:
+        dict: словарь {(маршрут, отпечаток): FingerprintStats}.
+    """
+
+    fingerprints = defaultdict(FingerprintStats)
+    if not os.path.isdir(directory):
+        return fingerprints
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.json'):
+            continue
+        with open(entry.path, encoding='utf-8') as file:
+            data = json.load(file)
+        for route, fingerprint, stats in data:
+            fingerprints[route, fingerprint].merge(
+                FingerprintStats.from_dict(stats)
+            )
+    return fingerprints
+
+
+query_stats = QueryStats()
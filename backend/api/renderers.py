@@ -0,0 +1,26 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class PlainTextRenderer(BaseRenderer):
+    """Выводит ответ обычным текстом (формат txt).
+
+    Используется для выбора формата списка покупок и для вывода ошибок в
+    этом формате.
+    """
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    """Выводит ответ в формате csv."""
+
+    media_type = 'text/csv'
+    format = 'csv'
@@ -0,0 +1,151 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from recipes.catalogue import INGREDIENTS, get_catalogue_version
+from recipes.models import Ingredient
+
+INGREDIENT_SEARCH_LIMIT = 50
+# Индекс пересобирается не реже, чем раз в INGREDIENT_INDEX_MAX_AGE секунд,
+# даже если версия справочника не менялась (например, после bulk_create
+# без вызова bump_catalogue_version).
+INGREDIENT_INDEX_MAX_AGE = 300
+# Символ больше любого символа названия: все строки, начинающиеся с
+# префикса, лежат между префиксом и префиксом с этим символом.
+MAX_CHAR = '\U0010ffff'
+
+
+def fold(text):
+    """Приводит строку к виду для поиска: без учета регистра, 'ё' = 'е'.
+
+    Args:
+        text (str): строка.
+
+    Returns:
+        str: строка для сравнения при поиске.
+    """
+
+    return text.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти воркера для автодополнения.
+
+    Хранит отсортированный список названий, приведенных функцией fold, и
+    отвечает на поиск по префиксу двоичным поиском (bisect), не обращаясь
+    к базе. Индекс строится при первом поиске и пересобирается, когда
+    меняется версия справочника ингредиентов (см. recipes.catalogue) или
+    истекает INGREDIENT_INDEX_MAX_AGE.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.built_at = None
+
+    def is_outdated(self, version):
+        """Проверяет, нужно ли пересобрать индекс.
+
+        Args:
+            version (tuple): текущая версия справочника ингредиентов.
+
+        Returns:
+            bool: True если индекс не построен или устарел.
+        """
+
+        return (
+            self.index is None
+            or version != self.version
+            or time.monotonic() - self.built_at > INGREDIENT_INDEX_MAX_AGE
+        )
+
+    def get_index(self):
+        """Возвращает индекс, при необходимости пересобрав его.
+
+        Returns:
+            tuple: отсортированный список ключей поиска, список
+            ингредиентов в том же порядке, ключи одной строкой через '\\n'
+            (для поиска вхождений) и смещения ключей в этой строке.
+        """
+
+        version = get_catalogue_version(INGREDIENTS)
+        if self.is_outdated(version):
+            with self.lock:
+                if self.is_outdated(version):
+                    self.build(version)
+        return self.index
+
+    def build(self, version):
+        """Строит индекс по всем ингредиентам из базы.
+
+        Args:
+            version (tuple): версия справочника, по которой строится индекс.
+        """
+
+        entries = sorted(
+            (fold(name), name, pk, measurement_unit)
+            for pk, name, measurement_unit
+            in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator()
+        )
+        keys = [entry[0] for entry in entries]
+        starts, offset = [], 0
+        for key in keys:
+            starts.append(offset)
+            offset += len(key) + 1
+        self.index = (
+            keys,
+            [
+                {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+                for _, name, pk, measurement_unit in entries
+            ],
+            '\n'.join(keys),
+            starts
+        )
+        self.version = version
+        self.built_at = time.monotonic()
+
+    def search(self, query, limit=INGREDIENT_SEARCH_LIMIT, substring=True):
+        """Ищет ингредиенты по началу названия.
+
+        Сначала выводятся точные совпадения, затем названия, начинающиеся с
+        запроса, затем (если substring=True и места хватает) названия,
+        содержащие запрос, - чем ближе к началу совпадение, тем выше.
+
+        Args:
+            query (str): набранная часть названия.
+            limit (int, опционально): максимальное количество результатов.
+            substring (bool, опционально): искать ли вхождения запроса в
+            середину названия. По умолчанию True.
+
+        Returns:
+            list: список словарей с полями 'id', 'name', 'measurement_unit'.
+        """
+
+        query = fold(query.strip())
+        keys, items, text, starts = self.get_index()
+        if not query:
+            return items[:limit]
+        start = bisect_left(keys, query)
+        end = bisect_right(keys, query + MAX_CHAR, lo=start)
+        results = items[start:min(end, start + limit)]
+        if not substring or len(results) >= limit or '\n' in query:
+            return results
+        matches = []
+        found = text.find(query)
+        while found != -1:
+            number = bisect_right(starts, found) - 1
+            if found > starts[number]:
+                matches.append((found - starts[number], number))
+            if number + 1 == len(starts):
+                break
+            found = text.find(query, starts[number + 1])
+        matches.sort()
+        return results + [
+            items[number] for _, number in matches[:limit - len(results)]
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -1,14 +1,55 @@
-from django.db.models import F
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
+from recipes.search import update_search_index
 from rest_framework import serializers
 from users.models import Subscribe, User
 
-from .utils import (INGREDIENTS, RECIPES_LIMIT, TAGS,
-                    create_recipe_ingredient_objects,
-                    tags_ingredients_validation)
+from .fields import RecipeImageField
+from .utils import (AUTHOR_RECIPES, INGREDIENTS, RECIPES_LIMIT, TAGS,
+                    create_recipe_ingredient_objects, get_image_srcset,
+                    get_recipe_ingredients_prefetch, get_recipes_limit,
+                    get_viewer_state, tags_ingredients_validation,
+                    update_recipe_ingredients)
+
+
+class ViewerStateListSerializer(serializers.ListSerializer):
+    """Сериализатор списка, который перед выводом загружает состояние
+    текущего пользователя (избранное, список покупок, подписки) сразу для
+    всех объектов списка.
+    """
+
+    def to_representation(self, data):
+        """Возвращает список сериализованных объектов.
+
+        Args:
+            data (QuerySet/list): список объектов.
+
+        Returns:
+            list: список сериализованных объектов.
+        """
+
+        iterable = data.all() if isinstance(data, Manager) else list(data)
+        self.child.preload_viewer_state(iterable)
+        return super().to_representation(iterable)
+
+
+class ImageVariantsField(serializers.Field):
+    """Поле с уменьшенными копиями картинки рецепта (только чтение).
+
+    Выводит словарь {формат: строка srcset}, см. get_image_srcset.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return get_image_srcset(recipe, self.context.get('request'))
 
 
 class CustomUserSerialaizer(UserSerializer):
@@ -26,6 +67,7 @@ class CustomUserSerialaizer(UserSerializer):
             'last_name',
             'is_subscribed'
         )
+        list_serializer_class = ViewerStateListSerializer
 
     def get_is_subscribed(self, obj):
         """Проверяет подписку на пользователя.
@@ -36,10 +78,17 @@ class CustomUserSerialaizer(UserSerializer):
         Returns:
             bool: статус подписки.
         """
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Subscribe.objects.filter(user=request.user, author=obj).exists()
+        return get_viewer_state(self.context).is_subscribed(obj)
+
+    def preload_viewer_state(self, users):
+        """Загружает подписки текущего пользователя на всех пользователей
+        списка одним запросом.
+
+        Args:
+            users (list): список пользователей.
+        """
+
+        get_viewer_state(self.context).load_authors(user.id for user in users)
 
 
 class SubscriptionRecipeSerializer(serializers.ModelSerializer):
@@ -47,9 +96,11 @@ class SubscriptionRecipeSerializer(serializers.ModelSerializer):
     подписан текущий пользователь.
     """
 
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class SubscriptionsSerializer(CustomUserSerialaizer):
@@ -70,6 +121,7 @@ class SubscriptionsSerializer(CustomUserSerialaizer):
             'recipes',
             'recipes_count'
         )
+        list_serializer_class = ViewerStateListSerializer
 
     def get_recipes(self, obj):
         """Возвращает сериализованный список рецептов пользователя на которого
@@ -79,15 +131,28 @@ class SubscriptionsSerializer(CustomUserSerialaizer):
             obj (User): объект пользователя на которого подписан текущий
             пользователь.
 
+        Если представление передало в контексте последние рецепты авторов
+        (AUTHOR_RECIPES), они используются без дополнительных запросов.
+
         Returns:
             rest_framework.utils.serializer_helpers.ReturnList: сериализованный
             список рецептов пользователя на которого подписан текущий
             пользователь.
         """
 
-        return SubscriptionRecipeSerializer(
-            obj.recipes.all()[:RECIPES_LIMIT], many=True
-        ).data
+        author_recipes = self.context.get(AUTHOR_RECIPES)
+        if author_recipes is not None and obj.id in author_recipes:
+            recipes = author_recipes[obj.id]
+        else:
+            request = self.context.get('request')
+            recipes_limit = (
+                RECIPES_LIMIT if request is None
+                else get_recipes_limit(request)
+            )
+            recipes = obj.recipes.prefetch_related(
+                'image_variants'
+            )[:recipes_limit]
+        return SubscriptionRecipeSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
         """Возвращает общее количество рецептов пользователя.
@@ -99,7 +164,7 @@ class SubscriptionsSerializer(CustomUserSerialaizer):
             int: общее количество рецептов пользователя.
         """
 
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -145,6 +210,7 @@ class RecipeReadSerialaizer(serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     ingredients = serializers.SerializerMethodField()
     author = CustomUserSerialaizer()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -157,9 +223,27 @@ class RecipeReadSerialaizer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time'
         )
+        list_serializer_class = ViewerStateListSerializer
+
+    def to_representation(self, instance):
+        """Возвращает словарь с данными рецепта.
+
+        Состояние пользователя загружается до вывода вложенного автора,
+        чтобы подписка на него была известна вместе с флагами рецепта.
+
+        Args:
+            instance (Recipe): объект рецепта.
+
+        Returns:
+            dict: словарь с данными рецепта.
+        """
+
+        self.preload_viewer_state([instance])
+        return super().to_representation(instance)
 
     def get_is_favorited(self, obj):
         """Проверяет наличие рецепта в избранном у текущего пользователя.
@@ -178,10 +262,7 @@ class RecipeReadSerialaizer(serializers.ModelSerializer):
             пользователя, иначе False.
         """
 
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(user=request.user, recipe=obj).exists()
+        return get_viewer_state(self.context).is_favorited(obj)
 
     def get_is_in_shopping_cart(self, obj):
         """Проверяет наличие рецепта в списке покупок текущего пользователя.
@@ -200,36 +281,48 @@ class RecipeReadSerialaizer(serializers.ModelSerializer):
             пользователя, иначе False.
         """
 
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(
-            user=request.user, recipe=obj
-        ).exists()
+        return get_viewer_state(self.context).is_in_shopping_cart(obj)
+
+    def preload_viewer_state(self, recipes):
+        """Загружает состояние текущего пользователя для всех рецептов
+        списка и их авторов.
+
+        Args:
+            recipes (list): список рецептов.
+        """
+
+        get_viewer_state(self.context).load_recipes(recipes)
 
     def get_ingredients(self, obj):
         """Возвращает список ингредиентов.
 
+        Ингредиенты берутся из предварительно загруженных строк
+        RecipeIngredient (см. get_recipe_ingredients_prefetch).
+
         Args:
             obj (Reipe): объект рецепта.
 
         Returns:
-            QuerySet: список ингредиентов.
+            list: список ингредиентов.
         """
 
-        return obj.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('recipe_ingredients__amount')
-        )
+        return [
+            {
+                'id': recipe_ingredient.ingredient.id,
+                'name': recipe_ingredient.ingredient.name,
+                'measurement_unit': (
+                    recipe_ingredient.ingredient.measurement_unit
+                ),
+                'amount': recipe_ingredient.amount
+            } for recipe_ingredient in obj.recipe_ingredients.all()
+        ]
 
 
 class RecipeCreateSerialaizer(serializers.ModelSerializer):
     """Сериализатор для создания рецепта."""
 
     ingredients = IngredientRecipeSerializer(many=True)
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(max_length=None, use_url=True)
 
     class Meta:
         model = Recipe
@@ -252,10 +345,12 @@ class RecipeCreateSerialaizer(serializers.ModelSerializer):
             dict: словарь с данными прошедшими валидацию.
         """
 
-        tags_ingredients_validation(data, INGREDIENTS)
-        tags_ingredients_validation(data, TAGS)
+        for element in (INGREDIENTS, TAGS):
+            if element in data:
+                tags_ingredients_validation(data, element)
         return super().validate(data)
 
+    @transaction.atomic
     def create(self, validated_data):
         """Создание рецепта.
 
@@ -273,25 +368,35 @@ class RecipeCreateSerialaizer(serializers.ModelSerializer):
         create_recipe_ingredient_objects(
             recipe, ingredients
         )
+        update_search_index([recipe.id])
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         """Обновление рецепта.
 
+        Теги и ингредиенты не пересоздаются: добавляются, удаляются и
+        изменяются только отличающиеся строки. Если теги или ингредиенты не
+        переданы (PATCH), они не меняются.
+
         Args:
             recipe (Recipe): объект рецепта.
             validated_data (dict): словарь с данными прошедшими валидацию.
 
         Returns:
-            Возвращает метод .update() родительского класса.
+            Recipe: объект рецепта.
         """
-        tags = validated_data.pop("tags")
-        ingredients = validated_data.pop("ingredients")
-        recipe.tags.set(tags)
-        if ingredients:
-            recipe.ingredients.clear()
-            create_recipe_ingredient_objects(recipe, ingredients)
-        return super().update(recipe, validated_data)
+        tags = validated_data.pop(TAGS, None)
+        ingredients = validated_data.pop(INGREDIENTS, None)
+        if tags is not None:
+            recipe.tags.set(tags)
+        reindex = 'name' in validated_data or 'text' in validated_data
+        if ingredients is not None:
+            reindex = update_recipe_ingredients(recipe, ingredients) or reindex
+        recipe = super().update(recipe, validated_data)
+        if reindex:
+            update_search_index([recipe.id])
+        return recipe
 
     def to_representation(self, instance):
         """Возвращает словарь с данными о созданном рецепте.
@@ -302,6 +407,10 @@ class RecipeCreateSerialaizer(serializers.ModelSerializer):
         Returns:
             dict: словарь с данными о созданном рецепте.
         """
+        prefetch_related_objects(
+            [instance], 'tags', get_recipe_ingredients_prefetch(),
+            'image_variants'
+        )
         return RecipeReadSerialaizer(
             instance,
             context={'request': self.context.get('request')}
@@ -312,10 +421,11 @@ class FavoriteShoppingCartRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для рецепта добавленного в избранное/список покупок."""
 
     image = Base64ImageField(max_length=None, use_url=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
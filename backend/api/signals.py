@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from .authentication import invalidate_tokens
+
+# Токены удаляются из кэша сразу и еще раз после фиксации транзакции: иначе
+# параллельный запрос успел бы снова закэшировать их из базы до фиксации.
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Удаляет токен из кэша при выходе из аккаунта или удалении
+    пользователя.
+    """
+
+    invalidate_tokens([instance.key])
+    transaction.on_commit(lambda: invalidate_tokens([instance.key]))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, update_fields,
+                           **kwargs):
+    """Удаляет токены пользователя из кэша при его изменении (смена пароля,
+    деактивация, изменение данных).
+
+    Вход пользователя (обновление только last_login) токены не меняет.
+    """
+
+    if created or update_fields and set(update_fields) == {'last_login'}:
+        return
+    keys = list(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+    invalidate_tokens(keys)
+    transaction.on_commit(lambda: invalidate_tokens(keys))
@@ -1,8 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (CustomUserViewSet, IngredientsViewSet, RecipeViewSet,
-                    TagsViewSet)
+from .views import (CustomUserViewSet, IngredientsViewSet, MetricsView,
+                    ProfilingTokenView, RecipeViewSet, TagsViewSet)
 
 router_v1 = DefaultRouter()
 
@@ -12,6 +12,11 @@ router_v1.register(r'tags', TagsViewSet, basename='tag')
 router_v1.register(r'ingredients', IngredientsViewSet, basename='ingredient')
 
 urlpatterns = [
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path(
+        'profiling-token', ProfilingTokenView.as_view(),
+        name='profiling-token'
+    ),
     path('', include(router_v1.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
@@ -1,8 +1,27 @@
+import csv
+import hashlib
+import json
+from collections import Counter
+from functools import wraps
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (Case, F, IntegerField, Prefetch, Value, When,
+                              Window, prefetch_related_objects)
+from django.db.models.functions import RowNumber
 from django.forms import ValidationError
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from recipes.models import Ingredient, Recipe, RecipeIngredient
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from recipes.catalogue import get_catalogue_version, get_response_generation
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem)
 from rest_framework import status
 from rest_framework.response import Response
+from users.models import Subscribe
 
 FAVORITE_EXISTS_MESSAGE = 'Рецепт уже добавлен в избранное'
 FAVORITE_MISSING_MESSAGE = 'Рецепт отсутствует в избранном'
@@ -24,6 +43,7 @@ DUPLICATE_MESSAGE = (
 )
 NEGATIVE_AMOUNT_MESSAGE = ('Количество ингредиента не может быть '
                            'отрицательным или равно нулю.')
+UNKNOWN_INGREDIENTS_MESSAGE = 'Ингредиенты с id {ids} не существуют.'
 INGREDIENTS = 'ingredients'
 INGREDIENT_RU = 'Ингредиент'
 INGREDIENTS_RU = 'Ингредиенты'
@@ -31,9 +51,255 @@ TAGS = 'tags'
 TAG_RU = 'Тег'
 TAGS_RU = 'Теги'
 
+RESPONSE_CACHE_TIMEOUT = 300
+RESPONSE_CACHE_KEY = 'anonymous_response:{generation}:{digest}'
+# Сколько секунд токен хранится в общем кэше (settings.TOKEN_SHARED_CACHE).
+TOKEN_CACHE_TIMEOUT = 300
+TOKEN_CACHE_KEY = 'token:{digest}'
+# Наибольший размер картинки рецепта, загружаемой файлом (multipart).
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
 RECIPES_LIMIT = 3
+RECIPES_LIMIT_PARAM = 'recipes_limit'
+AUTHOR_RECIPES = 'author_recipes'
+
+VIEWER_STATE = 'viewer_state'
+
+
+class ViewerState:
+    """Состояние текущего пользователя, общее для всех сериализаторов
+    одного запроса.
+
+    Хранит id рецептов в избранном и в списке покупок пользователя, а также
+    id авторов, на которых он подписан. Данные загружаются пачками для всех
+    выводимых объектов сразу, после чего ответы на вопросы "в избранном?",
+    "в списке покупок?", "есть подписка?" даются из памяти.
+
+    Attributes:
+        user (User): текущий пользователь.
+        favorites (set): id рецептов в избранном.
+        shopping_cart (set): id рецептов в списке покупок.
+        subscriptions (set): id авторов, на которых подписан пользователь.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.favorites = set()
+        self.shopping_cart = set()
+        self.subscriptions = set()
+        self.loaded_recipes = set()
+        self.loaded_authors = set()
+
+    def load_recipes(self, recipes):
+        """Загружает состояние пользователя для списка рецептов.
+
+        Если рецепты аннотированы флагами is_favorited, is_in_shopping_cart
+        и author_is_subscribed (см. RecipeViewSet.get_queryset), запросы к
+        базе не выполняются.
+
+        Args:
+            recipes (list): список рецептов.
+        """
+
+        recipes = [
+            recipe for recipe in recipes
+            if recipe.id not in self.loaded_recipes
+        ]
+        if not recipes:
+            return
+        self.loaded_recipes.update(recipe.id for recipe in recipes)
+        if self.user.is_anonymous:
+            return
+        recipe_ids, author_ids = [], []
+        for recipe in recipes:
+            if not hasattr(recipe, 'is_favorited'):
+                recipe_ids.append(recipe.id)
+                author_ids.append(recipe.author_id)
+                continue
+            if recipe.is_favorited:
+                self.favorites.add(recipe.id)
+            if recipe.is_in_shopping_cart:
+                self.shopping_cart.add(recipe.id)
+            if recipe.author_id not in self.loaded_authors:
+                self.loaded_authors.add(recipe.author_id)
+                if recipe.author_is_subscribed:
+                    self.subscriptions.add(recipe.author_id)
+        if recipe_ids:
+            self.favorites.update(Favorite.objects.filter(
+                user=self.user, recipe__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+            self.shopping_cart.update(ShoppingCart.objects.filter(
+                user=self.user, recipe__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+        self.load_authors(author_ids)
+
+    def load_authors(self, author_ids):
+        """Загружает подписки пользователя на авторов из списка.
+
+        Args:
+            author_ids (list): список id авторов.
+        """
+
+        author_ids = set(author_ids) - self.loaded_authors
+        if not author_ids:
+            return
+        self.loaded_authors.update(author_ids)
+        if self.user.is_anonymous:
+            return
+        self.subscriptions.update(Subscribe.objects.filter(
+            user=self.user, author__in=author_ids
+        ).values_list('author_id', flat=True))
+
+    def is_favorited(self, recipe):
+        """Проверяет наличие рецепта в избранном у пользователя."""
+
+        self.load_recipes([recipe])
+        return recipe.id in self.favorites
+
+    def is_in_shopping_cart(self, recipe):
+        """Проверяет наличие рецепта в списке покупок пользователя."""
+
+        self.load_recipes([recipe])
+        return recipe.id in self.shopping_cart
+
+    def is_subscribed(self, author):
+        """Проверяет подписку пользователя на автора."""
+
+        self.load_authors([author.id])
+        return author.id in self.subscriptions
+
+
+def get_viewer_state(context):
+    """Возвращает состояние текущего пользователя из контекста
+    сериализатора, создавая его при первом обращении.
+
+    Args:
+        context (dict): контекст сериализатора.
+
+    Returns:
+        ViewerState: состояние текущего пользователя.
+    """
+
+    if context.get(VIEWER_STATE) is None:
+        request = context.get('request')
+        context[VIEWER_STATE] = ViewerState(
+            AnonymousUser() if request is None else request.user
+        )
+    return context[VIEWER_STATE]
+
+
+def catalogue_cache(catalogue):
+    """Возвращает декоратор ViewSet справочника для условных GET-запросов.
+
+    Ответы методов list и retrieve получают заголовки ETag (версия
+    справочника), Last-Modified (время ее изменения) и Cache-Control:
+    no-cache - клиент хранит ответ, но перед каждым использованием
+    проверяет его версию. На запрос с If-None-Match или If-Modified-Since
+    для актуальной версии отдается ответ 304 без обращения к таблицам
+    справочника и сериализации.
+
+    Args:
+        catalogue (str): название справочника (TAGS или INGREDIENTS).
+
+    Returns:
+        function: декоратор класса ViewSet.
+    """
+
+    def get_etag(request, *args, **kwargs):
+        return str(get_catalogue_version(catalogue)[0])
+
+    def get_last_modified(request, *args, **kwargs):
+        return get_catalogue_version(catalogue)[1]
+
+    def view_decorator(view):
+        view = condition(
+            etag_func=get_etag, last_modified_func=get_last_modified
+        )(view)
+        return cache_control(public=True, no_cache=True)(view)
+
+    def decorator(viewset):
+        for name in ('list', 'retrieve'):
+            viewset = method_decorator(view_decorator, name=name)(viewset)
+        return viewset
+
+    return decorator
+
+
+def get_response_cache_key(request):
+    """Возвращает ключ кэша ответа на GET-запрос.
+
+    Параметры запроса нормализуются: порядок параметров и повторяющихся
+    значений (например, tags) не влияет на ключ. В ключ входит текущее
+    поколение ответов (recipes.catalogue.get_response_generation), поэтому
+    после любого изменения ответы ищутся по новым ключам, а старые
+    истекают сами.
+
+    Args:
+        request (Request): объект запроса.
+
+    Returns:
+        str: ключ кэша.
+    """
+
+    query = sorted(
+        (key, sorted(values)) for key, values in request.GET.lists()
+    )
+    digest = hashlib.md5(
+        f'{request.build_absolute_uri(request.path)}?{query}'.encode()
+    ).hexdigest()
+    return RESPONSE_CACHE_KEY.format(
+        generation=get_response_generation(), digest=digest
+    )
+
+
+def anonymous_response_cache(viewset):
+    """Декоратор ViewSet: кэширует ответы list и retrieve для анонимных
+    пользователей.
 
+    Ответ с кодом 200 сохраняется в кэш Django уже отрендеренным, вместе
+    с заголовками (Vary, Allow и другими, которые выставили DRF и
+    ViewSet). Повторный запрос с теми же параметрами отдается из кэша без
+    запросов к таблицам рецептов и сериализации. С общим кэшем
+    (settings.RESPONSE_SHARED_CACHE) поколение ответов берется из кэша,
+    иначе читается из базы на каждом запросе, поэтому устаревшие ответы не
+    отдаются и при отдельном кэше в памяти у каждого воркера.
 
+    Args:
+        viewset (ViewSet): класс ViewSet.
+
+    Returns:
+        ViewSet: класс ViewSet с кэшированием.
+    """
+
+    def cache_method(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if not request.user.is_anonymous:
+                return method(self, request, *args, **kwargs)
+            key = get_response_cache_key(request)
+            cached = cache.get(key)
+            if cached is not None:
+                content, headers = cached
+                response = HttpResponse(content)
+                for name, value in headers:
+                    response[name] = value
+                return response
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                response.add_post_render_callback(lambda rendered: cache.set(
+                    key,
+                    (rendered.content, list(rendered.items())),
+                    RESPONSE_CACHE_TIMEOUT
+                ))
+            return response
+        return wrapper
+
+    for name in ('list', 'retrieve'):
+        setattr(viewset, name, cache_method(getattr(viewset, name)))
+    return viewset
+
+
+@transaction.atomic
 def create_delete_object(
         request,
         pk,
@@ -45,6 +311,9 @@ def create_delete_object(
 ):
     """Добавляет/удаляет рецепт из избранного/списка покупок.
 
+    Выполняется в одной транзакции вместе с обновлением счетчиков и
+    сводного списка покупок (см. recipes.signals).
+
     Args:
         request (Request): объект запроса.
         pk (int): id рецепта.\n
@@ -93,9 +362,198 @@ def create_delete_object(
     )
 
 
+def get_recipe_ingredients_prefetch():
+    """Возвращает объект Prefetch для ингредиентов рецепта.
+
+    Строки RecipeIngredient загружаются одним запросом вместе с
+    ингредиентами и упорядочиваются по названию ингредиента.
+
+    Returns:
+        Prefetch: объект для prefetch_related.
+    """
+
+    return Prefetch(
+        'recipe_ingredients',
+        queryset=RecipeIngredient.objects.select_related(
+            'ingredient'
+        ).order_by('ingredient__name')
+    )
+
+
+def get_image_srcset(recipe, request=None):
+    """Возвращает уменьшенные копии картинки рецепта в формате srcset.
+
+    Копии создаются в фоне после сохранения рецепта, поэтому сразу после
+    загрузки картинки словарь может быть пустым.
+
+    Args:
+        recipe (Recipe): объект рецепта.
+        request (Request, опционально): объект запроса для абсолютных
+        ссылок. По умолчанию None.
+
+    Returns:
+        dict: словарь {формат: 'ссылка 480w, ссылка 960w, ...'}.
+    """
+
+    srcset = {}
+    for variant in recipe.image_variants.all():
+        url = variant.image.url
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        srcset.setdefault(variant.format, []).append(f'{url} {variant.width}w')
+    return {
+        variant_format: ', '.join(urls)
+        for variant_format, urls in srcset.items()
+    }
+
+
+SHOPPING_LIST_FILENAME = 'shopping_list.{format}'
+SHOPPING_LIST_CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+SHOPPING_LIST_CONTENT_TYPES = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+}
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку вместо
+    сохранения.
+    """
+
+    def write(self, value):
+        return value
+
+
+def get_shopping_list(user):
+    """Возвращает итератор по сводному списку покупок пользователя.
+
+    Строки читаются из таблицы ShoppingListItem, где количество уже
+    просуммировано по ингредиентам, по мере вывода.
+
+    Args:
+        user (User): пользователь.
+
+    Returns:
+        iterator: словари с ключами 'name', 'measurement_unit', 'amount'.
+    """
+
+    return ShoppingListItem.objects.filter(user=user).values(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+        amount=F('total_amount')
+    ).order_by('name', 'measurement_unit').iterator()
+
+
+def stream_shopping_list(items, file_format):
+    """Построчно выводит список покупок в заданном формате.
+
+    Args:
+        items (iterator): строки списка покупок (см. get_shopping_list).
+        file_format (str): формат файла: 'txt', 'csv' или 'json'.
+
+    Yields:
+        str: очередной фрагмент файла.
+    """
+
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(SHOPPING_LIST_CSV_HEADER)
+        for item in items:
+            yield writer.writerow(
+                (item['name'], item['amount'], item['measurement_unit'])
+            )
+    elif file_format == 'json':
+        separator = '['
+        for item in items:
+            yield separator + json.dumps(item, ensure_ascii=False)
+            separator = ',\n'
+        yield '[]' if separator == '[' else ']'
+    else:
+        for item in items:
+            yield (f"- {item['name']}: {item['amount']} "
+                   f"{item['measurement_unit']}\n")
+
+
+def get_recipes_limit(request):
+    """Возвращает количество рецептов автора для вывода в подписках.
+
+    Args:
+        request (Request): объект запроса.
+
+    Returns:
+        int: значение параметра recipes_limit из запроса, либо RECIPES_LIMIT
+        если параметр не указан или указан неверно.
+    """
+
+    recipes_limit = request.query_params.get(RECIPES_LIMIT_PARAM, '')
+    if recipes_limit.isdigit():
+        return int(recipes_limit)
+    return RECIPES_LIMIT
+
+
+def get_latest_recipes(author_ids, limit):
+    """Возвращает последние рецепты каждого автора из списка.
+
+    Рецепты всех авторов выбираются одним запросом с оконной функцией
+    ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY pub_date DESC).
+
+    Args:
+        author_ids (list): список id авторов.
+        limit (int): количество рецептов каждого автора.
+
+    Returns:
+        dict: словарь {id автора: список его последних рецептов}.
+    """
+
+    author_recipes = {author_id: [] for author_id in author_ids}
+    if not author_recipes or limit <= 0:
+        return author_recipes
+    recipes = Recipe.objects.filter(author__in=author_ids).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=F('author'),
+            order_by=(F('pub_date').desc(), F('id').desc())
+        )
+    ).order_by()
+    sql, params = recipes.query.sql_with_params()
+    for recipe in Recipe.objects.raw(
+        f'SELECT * FROM ({sql}) AS latest_recipes WHERE row_number <= %s '
+        'ORDER BY pub_date DESC, id DESC',
+        (*params, limit)
+    ):
+        author_recipes[recipe.author_id].append(recipe)
+    prefetch_related_objects(
+        [recipe for recipes in author_recipes.values() for recipe in recipes],
+        'image_variants'
+    )
+    return author_recipes
+
+
+def update_shopping_lists(recipe, old_amounts, new_amounts):
+    """Обновляет сводные списки покупок всех пользователей, у которых
+    рецепт находится в списке покупок, после изменения его ингредиентов.
+
+    Args:
+        recipe (Recipe): объект рецепта.
+        old_amounts (dict): прежние количества {id ингредиента: количество}.
+        new_amounts (dict): новые количества {id ингредиента: количество}.
+    """
+
+    amounts = dict(new_amounts)
+    for ingredient_id, amount in old_amounts.items():
+        amounts[ingredient_id] = amounts.get(ingredient_id, 0) - amount
+    ShoppingListItem.change_amounts(
+        recipe.shopping_cart.values_list('user_id', flat=True), amounts
+    )
+
+
 def create_recipe_ingredient_objects(recipe, ingredients):
     """Добавляет ингредиенты в рецепт.
 
+    Ингредиенты не запрашиваются из базы: их существование проверено при
+    валидации (см. tags_ingredients_validation).
+
     Args:
         recipe (Recipe): объект рецепта.
         ingredients (list): список ингредиентов.
@@ -104,20 +562,71 @@ def create_recipe_ingredient_objects(recipe, ingredients):
     RecipeIngredient.objects.bulk_create(
         RecipeIngredient(
             recipe=recipe,
-            ingredient=get_object_or_404(Ingredient, id=ingredient['id']),
+            ingredient_id=ingredient['id'],
             amount=ingredient['amount']
         ) for ingredient in ingredients
     )
 
 
+def update_recipe_ingredients(recipe, ingredients):
+    """Приводит ингредиенты рецепта к переданному списку.
+
+    Сравнивает переданные ингредиенты с текущими и только добавляет новые,
+    удаляет лишние и меняет изменившиеся количества (одним запросом).
+    Сводные списки покупок изменяются на разницу в количествах.
+
+    Args:
+        recipe (Recipe): объект рецепта.
+        ingredients (list): новый список ингредиентов.
+
+    Returns:
+        bool: True если изменился состав ингредиентов.
+    """
+
+    old_amounts = recipe.get_ingredient_amounts()
+    new_amounts = {
+        ingredient['id']: ingredient['amount'] for ingredient in ingredients
+    }
+    if new_amounts == old_amounts:
+        return False
+    removed = old_amounts.keys() - new_amounts.keys()
+    added = new_amounts.keys() - old_amounts.keys()
+    changed = {
+        ingredient_id: amount for ingredient_id, amount in new_amounts.items()
+        if old_amounts.get(ingredient_id, amount) != amount
+    }
+    if removed:
+        recipe.recipe_ingredients.filter(ingredient_id__in=removed).delete()
+    if added:
+        create_recipe_ingredient_objects(recipe, [
+            {'id': ingredient_id, 'amount': new_amounts[ingredient_id]}
+            for ingredient_id in added
+        ])
+    if changed:
+        recipe.recipe_ingredients.filter(ingredient_id__in=changed).update(
+            amount=Case(
+                *(
+                    When(ingredient_id=ingredient_id, then=Value(amount))
+                    for ingredient_id, amount in changed.items()
+                ),
+                output_field=IntegerField()
+            )
+        )
+    update_shopping_lists(recipe, old_amounts, new_amounts)
+    return bool(removed or added)
+
+
 def tags_ingredients_validation(data, element):
     """Проверяет ингредиенты и теги при создании рецепта.
 
+    Все ингредиенты запрашиваются из базы одним запросом.
+
     Args:
         data (dict): словарь с входящими данными.
         element (str): тег или ингредиент.
 
     Raises:
+        ValidationError: ошибка если указаны несуществующие ингредиенты.
         ValidationError: ошибка если указано отрицательное количество
         ингредиента.
         ValidationError: ошибка если тег или ингредиент дублируется.
@@ -126,24 +635,23 @@ def tags_ingredients_validation(data, element):
     elements = data[element]
     element_is_ingredient = True if element == INGREDIENTS else False
     if element_is_ingredient:
-        ingredients = [
-            get_object_or_404(Ingredient, id=ingredient['id']).name
-            for ingredient in elements
-        ]
-        negative_amount = [
-            ingredient['amount'] for ingredient in elements
-            if ingredient['amount'] <= 0
-        ]
+        ids = [ingredient['id'] for ingredient in elements]
+        ingredients = Ingredient.objects.only('name').in_bulk(ids)
+        unknown_ids = sorted(set(ids) - ingredients.keys())
+        if unknown_ids:
+            raise ValidationError(UNKNOWN_INGREDIENTS_MESSAGE.format(
+                ids=', '.join(map(str, unknown_ids))
+            ))
+        if any(ingredient['amount'] <= 0 for ingredient in elements):
+            raise ValidationError(NEGATIVE_AMOUNT_MESSAGE)
         duplicate_objects = [
-            ingredient for ingredient in ingredients
-            if ingredients.count(ingredient) > 1
+            ingredients[pk].name for pk, count in Counter(ids).items()
+            if count > 1
         ]
-        if negative_amount:
-            raise ValidationError(NEGATIVE_AMOUNT_MESSAGE)
     else:
         duplicate_objects = [
-            tag for tag in elements
-            if elements.count(tag) > 1
+            tag.name for tag, count in Counter(elements).items()
+            if count > 1
         ]
     length = len(duplicate_objects)
     plural_ending = PLURAL_INGREDIENT if element_is_ingredient else PLURAL_TAG
@@ -153,11 +661,8 @@ def tags_ingredients_validation(data, element):
                 element_plural=(INGREDIENTS_RU if element_is_ingredient
                                 else TAGS_RU),
                 element=INGREDIENT_RU if element_is_ingredient else TAG_RU,
-                ending=plural_ending if length > 2 else SINGULAR,
-                elements=", ".join(
-                    set([ingredient for ingredient in duplicate_objects])
-                ) if element_is_ingredient
-                else ", ".join(set([tag.name for tag in duplicate_objects])),
-                must=PLURAL_MUST if length > 2 else SINGULAR_MUST
+                ending=plural_ending if length > 1 else SINGULAR,
+                elements=', '.join(duplicate_objects),
+                must=PLURAL_MUST if length > 1 else SINGULAR_MUST
             )
         )
@@ -1,41 +1,97 @@
-from django.db.models import Sum
-from django.shortcuts import HttpResponse, get_object_or_404
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from recipes.catalogue import INGREDIENTS, TAGS
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.decorators import permission_classes as permissions
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from users.models import Subscribe, User
 
-from .filters import IngredientSearchFilter, RecipeFilter
-from .paginators import CustomPageNumberPagination
-from .permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
+from .filters import RecipeFilter, RecipeSearchFilter
+from .metrics import METRICS_CONTENT_TYPE, request_metrics
+from .paginators import RecipePagination
+from .parsers import MultiPartJSONParser
+from .permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly, IsSuperuser
+from .profiling import PROFILE_TOKEN_MAX_AGE, create_profile_token
+from .renderers import CSVRenderer, PlainTextRenderer
+from .search import ingredient_index
 from .serializers import (CustomUserSerialaizer, FavoriteSerializer,
                           IngredientSerializer, RecipeCreateSerialaizer,
                           RecipeReadSerialaizer, ShoppingCartSerializer,
                           SubscribeSerializer, SubscriptionsSerializer,
                           TagSerializer)
-from .utils import (FAVORITE_EXISTS_MESSAGE, FAVORITE_MISSING_MESSAGE,
-                    FROM_FAVORITE, FROM_SHOPING_CART,
+from .utils import (AUTHOR_RECIPES, FAVORITE_EXISTS_MESSAGE,
+                    FAVORITE_MISSING_MESSAGE, FROM_FAVORITE, FROM_SHOPING_CART,
                     SHOPING_CART_EXISTS_MESSAGE, SHOPING_CART_MISSING_MESSAGE,
-                    UNSUBSCRIBE_MESSAGE, create_delete_object)
+                    SHOPPING_LIST_CONTENT_TYPES, SHOPPING_LIST_FILENAME,
+                    UNSUBSCRIBE_MESSAGE, anonymous_response_cache,
+                    catalogue_cache, create_delete_object, get_latest_recipes,
+                    get_recipe_ingredients_prefetch, get_recipes_limit,
+                    get_shopping_list, stream_shopping_list)
 
 
+@anonymous_response_cache
 class RecipeViewSet(viewsets.ModelViewSet):
     """ViewSet для работы с рецептами."""
 
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrReadOnly,)
-    pagination_class = CustomPageNumberPagination
-    filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
+    parser_classes = (JSONParser, MultiPartJSONParser)
+    pagination_class = RecipePagination
+    filter_backends = (
+        DjangoFilterBackend, filters.OrderingFilter, RecipeSearchFilter
+    )
     filterset_class = RecipeFilter
     ordering_fields = ('pub_date',)
     ordering = ('-pub_date',)
 
+    def get_queryset(self):
+        """Возвращает список рецептов.
+
+        Для чтения рецепты дополняются флагами is_favorited,
+        is_in_shopping_cart и author_is_subscribed (подзапросы Exists),
+        автор подгружается через select_related, а теги, ингредиенты и копии
+        картинки - через prefetch_related. Так страница любого размера
+        выводится фиксированным количеством запросов.
+
+        Returns:
+            QuerySet: список рецептов.
+        """
+        queryset = super().get_queryset()
+        if self.request.method != 'GET':
+            return queryset
+        queryset = queryset.select_related('author').prefetch_related(
+            'tags',
+            get_recipe_ingredients_prefetch(),
+            'image_variants'
+        )
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                author_is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Subscribe.objects.filter(
+                user=user, author=OuterRef('author')
+            ))
+        )
+
     def get_serializer_class(self):
         """Возвращает класс сериализатора.
 
@@ -119,40 +175,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
             FROM_SHOPING_CART
         )
 
-    @action(methods=('get',), detail=False)
-    @permissions([IsAuthenticated])
+    @action(
+        methods=('get',),
+        detail=False,
+        renderer_classes=(PlainTextRenderer, CSVRenderer, JSONRenderer),
+        permission_classes=(IsAuthenticated,)
+    )
     def download_shopping_cart(self, request):
-        """Скачивает текстовый файл с ингридиентами из списка покупок.
+        """Скачивает файл с ингридиентами из списка покупок.
+
+        Формат файла выбирается параметром format (txt, csv или json, по
+        умолчанию txt). Файл отдается потоком: строки сводного списка
+        читаются из базы по мере отправки, поэтому расход памяти не зависит
+        от размера списка покупок.
 
         Args:
             request (Request): объект запроса.
 
         Returns:
-            HttpResponse: объект ответа.
+            StreamingHttpResponse: объект ответа.
         """
-        shopping_cart = {}
-        # Фильтруем объекты RecipeIngredient по текущему пользователю,
-        # достаем поля ингредиента(только 'name' и 'measurement_unit')
-        # и суммируем в поле ingredient_amount количество каждого ингредиента
-        # затем создаем кортеж со значениями этих полей.
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(ingredient_amount=Sum('amount')).values_list(
-            'ingredient__name',
-            'ingredient__measurement_unit',
-            'ingredient_amount'
+        file_format = request.accepted_renderer.format
+        response = StreamingHttpResponse(
+            stream_shopping_list(get_shopping_list(request.user), file_format),
+            content_type=SHOPPING_LIST_CONTENT_TYPES[file_format]
         )
-        for ingredient in ingredients:
-            shopping_cart[ingredient[0]] = (ingredient[1], ingredient[2])
-        shopping_list = '\n'.join(
-            [f"- {item}: {value[1]} {value[0]}"
-             for item, value in shopping_cart.items()]
+        response['Content-Disposition'] = (
+            'attachment; filename="{}"'.format(
+                SHOPPING_LIST_FILENAME.format(format=file_format)
+            )
         )
-        response = HttpResponse(shopping_list, 'Content-Type: text/plain')
-        response['Content-Disposition'] = ('attachment; filename='
-                                           '"shopping_list.txt"')
         return response
 
 
@@ -173,13 +225,23 @@ class CustomUserViewSet(UserViewSet):
         Returns:
             Разбитый на страницы список подписок если их количество больше
             установленного в настройках пагинатора.
+
+        Последние рецепты (не больше recipes_limit) всех авторов страницы
+        выбираются одним запросом.
         """
         queryset = User.objects.filter(following__user=request.user)
         page = self.paginate_queryset(queryset)
+        authors = list(queryset) if page is None else page
         serializer = SubscriptionsSerializer(
-            queryset,
+            authors,
             many=True,
-            context={'request': self.request}
+            context={
+                'request': request,
+                AUTHOR_RECIPES: get_latest_recipes(
+                    [author.id for author in authors],
+                    get_recipes_limit(request)
+                )
+            }
         )
         if page is not None:
             return self.get_paginated_response(serializer.data)
@@ -221,6 +283,7 @@ class CustomUserViewSet(UserViewSet):
         )
 
 
+@catalogue_cache(TAGS)
 class TagsViewSet(viewsets.ModelViewSet):
     """ViewSet для работы с тегами."""
 
@@ -231,6 +294,7 @@ class TagsViewSet(viewsets.ModelViewSet):
     search_fields = ('name',)
 
 
+@catalogue_cache(INGREDIENTS)
 class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet для работы с ингредиентами."""
 
@@ -238,5 +302,66 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     permission_classes = (IsAdminOrReadOnly,)
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend, )
-    filter_class = IngredientSearchFilter
+
+    def list(self, request, *args, **kwargs):
+        """Выводит список ингредиентов.
+
+        Если указан параметр name, ингредиенты ищутся по началу названия в
+        индексе в памяти (см. IngredientIndex): сначала точные совпадения,
+        затем совпадения по началу названия, затем по его части.
+
+        Args:
+            request (Request): объект запроса.
+
+        Returns:
+            Response: список ингредиентов.
+        """
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
+
+class MetricsView(APIView):
+    """Выводит метрики запросов воркера в формате Prometheus (только для
+    администраторов).
+    """
+
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PlainTextRenderer,)
+
+    def get(self, request):
+        """Возвращает метрики запросов (см. api.metrics).
+
+        Args:
+            request (Request): объект запроса.
+
+        Returns:
+            HttpResponse: метрики в текстовом формате Prometheus.
+        """
+        return HttpResponse(
+            request_metrics.render(), content_type=METRICS_CONTENT_TYPE
+        )
+
+
+class ProfilingTokenView(APIView):
+    """Выдает суперпользователю токен профилирования запросов."""
+
+    permission_classes = (IsSuperuser,)
+
+    def post(self, request):
+        """Создает токен профилирования (см. api.profiling).
+
+        Токен передается в заголовке X-Profile или параметре profile
+        профилируемого запроса.
+
+        Args:
+            request (Request): объект запроса.
+
+        Returns:
+            Response: токен и срок его действия в секундах.
+        """
+        return Response({
+            'token': create_profile_token(request.user),
+            'max_age': PROFILE_TOKEN_MAX_AGE,
+        })
@@ -0,0 +1,80 @@
+import inspect
+import time
+
+from django.db import connections
+from django.urls import Resolver404, get_resolver, resolve
+from recipes.catalogue import INGREDIENTS, RECIPES, TAGS, get_catalogue_version
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+from . import serializers
+from .search import ingredient_index
+
+# Адрес, которого нет среди маршрутов: его поиск проходит по всем
+# маршрутам и компилирует их регулярные выражения.
+WARMUP_MISSING_PATH = '/warmup-missing-path/'
+
+
+def load_url_resolvers():
+    """Компилирует регулярные выражения маршрутов и заполняет словари
+    reverse().
+    """
+
+    get_resolver().reverse_dict
+    try:
+        resolve(WARMUP_MISSING_PATH)
+    except Resolver404:
+        pass
+
+
+def load_serializers():
+    """Создает поля всех сериализаторов API (и заполняет кэши _meta
+    моделей, которые они используют).
+    """
+
+    for serializer in vars(serializers).values():
+        if inspect.isclass(serializer) and issubclass(
+            serializer, BaseSerializer
+        ) and not issubclass(serializer, ListSerializer) and (
+            serializer.__module__ == serializers.__name__
+        ):
+            serializer().fields
+
+
+def load_catalogues():
+    """Загружает версии справочников в кэш и строит индекс поиска
+    ингредиентов.
+    """
+
+    for catalogue in (TAGS, INGREDIENTS, RECIPES):
+        get_catalogue_version(catalogue)
+    ingredient_index.get_index()
+
+
+WARMUP_STEPS = (
+    ('urls', load_url_resolvers),
+    ('serializers', load_serializers),
+    ('catalogues', load_catalogues),
+)
+
+
+def warm_up():
+    """Прогревает воркер, чтобы первые запросы после запуска не были
+    медленными.
+
+    Соединение с базой, открытое для загрузки справочников, закрывается:
+    оно принадлежит потоку, в котором вызван прогрев, а запросы воркера
+    gthread выполняются в других потоках со своими соединениями.
+
+    Returns:
+        list: пары (шаг, время в секундах).
+    """
+
+    timings = []
+    try:
+        for name, step in WARMUP_STEPS:
+            started = time.perf_counter()
+            step()
+            timings.append((name, time.perf_counter() - started))
+    finally:
+        connections.close_all()
+    return timings
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+# Запросы на чтение, которые выполняются в отдельном пуле потоков.
+READ_METHODS = ('GET', 'HEAD')
+READ_PATHS = re.compile(r'^/api/(recipes|tags|ingredients)/')
+
+
+class AsgiHandler:
+    """ASGI-приложение для Django 2.2, в котором нет своего ASGI.
+
+    Запросы принимаются в цикле событий (например, воркером uvicorn), а
+    обрабатываются WSGI-приложением Django в пулах потоков: пока один
+    запрос ждет базу, процесс обслуживает другие, и для одновременных
+    запросов нужны потоки, а не процессы. Чтения рецептов, тегов,
+    ингредиентов и списка покупок (READ_PATHS) выполняются в пуле
+    settings.ASGI_READ_THREADS потоков, остальные запросы - в пуле
+    settings.ASGI_THREADS потоков, поэтому медленные записи не занимают
+    потоки чтений. Весь запрос, включая отправку потокового ответа,
+    выполняется в одном потоке: соединения Django с базой привязаны к
+    потоку.
+    """
+
+    def __init__(self):
+        self.wsgi_application = get_wsgi_application()
+        self.read_executor = ThreadPoolExecutor(
+            settings.ASGI_READ_THREADS, thread_name_prefix='asgi-read'
+        )
+        self.executor = ThreadPoolExecutor(
+            settings.ASGI_THREADS, thread_name_prefix='asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported ASGI scope: {scope["type"]}')
+        with SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        ) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            loop = asyncio.get_running_loop()
+            executor = self.read_executor if (
+                scope['method'] in READ_METHODS
+                and READ_PATHS.match(scope['path'])
+            ) else self.executor
+            await loop.run_in_executor(
+                executor, self.handle, self.get_environ(scope, body),
+                partial(self.send_sync, loop, send)
+            )
+
+    async def lifespan(self, receive, send):
+        """Обрабатывает запуск и остановку сервера.
+
+        При остановке дожидается запросов, которые еще выполняются в
+        пулах потоков.
+
+        Args:
+            receive (callable): получение сообщений сервера.
+            send (callable): отправка сообщений серверу.
+        """
+
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                loop = asyncio.get_running_loop()
+                for executor in (self.read_executor, self.executor):
+                    await loop.run_in_executor(None, executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    def send_sync(loop, send, message):
+        """Отправляет сообщение ASGI из потока обработки запроса и ждет
+        отправки (так медленный клиент притормаживает потоковый ответ).
+
+        Args:
+            loop (AbstractEventLoop): цикл событий сервера.
+            send (callable): отправка сообщений серверу.
+            message (dict): сообщение.
+        """
+
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    @staticmethod
+    def get_environ(scope, body):
+        """Возвращает окружение WSGI для запроса ASGI.
+
+        Args:
+            scope (dict): описание запроса ASGI.
+            body (file): тело запроса.
+
+        Returns:
+            dict: окружение WSGI.
+        """
+
+        script_name = scope.get('root_path', '').encode().decode('latin-1')
+        path_info = scope['path'].encode().decode('latin-1')
+        if path_info.startswith(script_name):
+            path_info = path_info[len(script_name):]
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': script_name,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+            'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = f'HTTP_{name}'
+            value = value.decode('latin-1')
+            if name in environ:
+                value = f'{environ[name]},{value}'
+            environ[name] = value
+        return environ
+
+    def handle(self, environ, send):
+        """Выполняет запрос WSGI-приложением и отправляет ответ.
+
+        Выполняется в потоке пула.
+
+        Args:
+            environ (dict): окружение WSGI.
+            send (callable): синхронная отправка сообщений ASGI.
+        """
+
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            start.update(
+                type='http.response.start', status=int(status[:3]),
+                headers=[
+                    (name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in headers
+                ]
+            )
+
+        response = self.wsgi_application(environ, start_response)
+        try:
+            send(start)
+            for chunk in response:
+                if chunk and environ['REQUEST_METHOD'] != 'HEAD':
+                    send({
+                        'type': 'http.response.body', 'body': chunk,
+                        'more_body': True
+                    })
+            send({'type': 'http.response.body'})
+        finally:
+            # Django закрывает соединения с базой по сигналу окончания
+            # запроса, который отправляется при закрытии ответа.
+            response.close()
+
+
+application = AsgiHandler()
@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+
+# Настройки gunicorn: gunicorn -c python:foodgram.gunicorn_conf
+# foodgram.wsgi:application (или foodgram.asgi:application с
+# GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker).
+
+CGROUP_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_CPU_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+CGROUP_CPU_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+
+
+def get_cpu_count():
+    """Возвращает количество ядер, доступных процессу, с учетом привязки к
+    ядрам и квоты CPU контейнера (cgroup v2 или v1).
+
+    Returns:
+        int: количество ядер, не меньше 1.
+    """
+
+    if hasattr(os, 'sched_getaffinity'):
+        count = len(os.sched_getaffinity(0))
+    else:
+        count = multiprocessing.cpu_count()
+    try:
+        if os.path.exists(CGROUP_CPU_MAX):
+            with open(CGROUP_CPU_MAX) as file:
+                quota, period = file.read().split()
+        else:
+            with open(CGROUP_CPU_QUOTA) as quota_file, open(
+                CGROUP_CPU_PERIOD
+            ) as period_file:
+                quota, period = quota_file.read(), period_file.read()
+        if quota.strip() not in ('max', '-1'):
+            count = min(count, int(quota) // int(period))
+    except (OSError, ValueError):
+        pass
+    return max(count, 1)
+
+
+cpu_count = get_cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# Процессов по числу ядер (+1 на время ожидания ввода-вывода), в каждом
+# несколько потоков: пока один поток ждет базу, работают другие.
+workers = int(os.getenv('GUNICORN_WORKERS', cpu_count + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# Приложение импортируется в мастере до запуска воркеров: воркеры делят
+# загруженный код (copy-on-write) и запускаются быстрее.
+preload_app = True
+# Воркер перезапускается после max_requests (+ случайно до
+# max_requests_jitter, чтобы воркеры не перезапускались одновременно)
+# запросов: так не накапливаются утечки памяти.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+# Файлы пульса воркеров в памяти, а не на диске контейнера.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+
+def post_fork(server, worker):
+    """Прогревает воркер после запуска (см. api.warmup)."""
+
+    from api.warmup import warm_up
+
+    try:
+        timings = warm_up()
+    except Exception:
+        server.log.exception('Worker %s warmup failed', worker.pid)
+        return
+    server.log.info(
+        'Worker %s warmed up: %s', worker.pid,
+        ', '.join(f'{name} {duration * 1000:.0f} ms'
+                  for name, duration in timings)
+    )
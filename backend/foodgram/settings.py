@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from django.utils.encoding import force_str
 from dotenv import find_dotenv, load_dotenv
@@ -32,6 +33,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
+    'api.middleware.QueryStatsMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,7 +77,25 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', '1234qwer'),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Сколько секунд держать соединение с базой открытым между
+        # запросами (0 - закрывать после каждого запроса).
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+    }
+}
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Локальный кэш в памяти работает без внешних сервисов, но у каждого воркера
+# он свой. Файловый кэш (django.core.cache.backends.filebased.FileBasedCache
+# с каталогом в CACHE_LOCATION) общий для воркеров одного сервера.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
@@ -128,7 +150,7 @@ REST_FRAMEWORK = {
     ],
 
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -140,6 +162,44 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Кэшировать токены авторизации в CACHES. Включать только с кэшем, общим
+# для всех воркеров (memcached, redis, файловый), а не с LocMemCache:
+# иначе удаленный токен остается в кэше других воркеров.
+TOKEN_SHARED_CACHE = os.getenv('TOKEN_SHARED_CACHE', 'False') == 'True'
+# Хранить поколение закэшированных ответов с рецептами в CACHES (счетчик,
+# который увеличивается при изменении данных), а не читать его из базы на
+# каждом анонимном запросе. Включать, как и TOKEN_SHARED_CACHE, только с
+# кэшем, общим для всех воркеров.
+RESPONSE_SHARED_CACHE = os.getenv('RESPONSE_SHARED_CACHE', 'False') == 'True'
+
+# Профилировать автоматически каждый N-й запрос (0 - только по токену
+# суперпользователя, см. api.profiling). Профили хранятся в PROFILE_DIR,
+# старые удаляются сверх PROFILE_MAX_FILES.
+PROFILE_SAMPLE_RATE = int(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.getenv(
+    'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-profiles')
+)
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 100))
+
+# Статистика отпечатков SQL-запросов по маршрутам (см. api.querystats и
+# команду query_stats). Воркеры записывают ее в QUERY_STATS_DIR раз в
+# QUERY_STATS_FLUSH_INTERVAL секунд. Повторение одного запроса больше
+# QUERY_STATS_N_PLUS_ONE_THRESHOLD раз за запрос к API считается N+1.
+QUERY_STATS_ENABLED = os.getenv('QUERY_STATS_ENABLED', 'False') == 'True'
+QUERY_STATS_DIR = os.getenv(
+    'QUERY_STATS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram-queries')
+)
+QUERY_STATS_FLUSH_INTERVAL = int(os.getenv('QUERY_STATS_FLUSH_INTERVAL', 60))
+QUERY_STATS_N_PLUS_ONE_THRESHOLD = int(
+    os.getenv('QUERY_STATS_N_PLUS_ONE_THRESHOLD', 5)
+)
+
+# Потоки ASGI-приложения (foodgram.asgi) в каждом воркере: для чтений
+# рецептов, тегов, ингредиентов и списка покупок и для остальных запросов.
+# Каждому потоку нужно свое соединение с базой.
+ASGI_READ_THREADS = int(os.getenv('ASGI_READ_THREADS', 16))
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 4))
+
 DJOSER = {
     'HIDE_USERS': False,
     'SERIALIZERS': {
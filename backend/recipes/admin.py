@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
+from .search import update_search_index
 
 
 class IngredientRecipeInline(admin.TabularInline):
@@ -14,9 +15,31 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     list_filter = ('author', 'name', 'tags')
     inlines = (IngredientRecipeInline,)
+    readonly_fields = ('favorites_count', 'cart_count')
 
     def favorite_total(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        """Сохраняет ингредиенты и теги рецепта, обновляет поисковый индекс
+        и сводные списки покупок пользователей, у которых рецепт в списке
+        покупок.
+        """
+
+        recipe = form.instance
+        old_amounts = recipe.get_ingredient_amounts() if change else {}
+        super().save_related(request, form, formsets, change)
+        new_amounts = recipe.get_ingredient_amounts() if change else {}
+        if new_amounts != old_amounts:
+            ShoppingListItem.change_amounts(
+                recipe.shopping_cart.values_list('user_id', flat=True),
+                {
+                    ingredient_id: new_amounts.get(ingredient_id, 0)
+                    - old_amounts.get(ingredient_id, 0)
+                    for ingredient_id in old_amounts.keys() | new_amounts
+                }
+            )
+        update_search_index([recipe.id])
 
     favorite_total.short_description = 'Количество добавлений в избранное'
 
@@ -46,3 +69,10 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
     search_fields = ('user',)
     list_filter = ('user',)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'total_amount')
+    search_fields = ('user',)
+    list_filter = ('user',)
@@ -0,0 +1,142 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CatalogueVersion
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+# Поколение данных, из которых строятся ответы со списком и страницей
+# рецепта (рецепты, их ингредиенты, теги, авторы, копии картинок).
+RECIPES = 'recipes'
+CATALOGUE_VERSION_KEY = 'catalogue_version:{catalogue}'
+# Сколько секунд воркер может использовать закэшированную версию
+# справочника, не перечитывая ее из базы.
+CATALOGUE_VERSION_TIMEOUT = 60
+# Счетчик поколения закэшированных ответов с рецептами в общем кэше
+# (settings.RESPONSE_SHARED_CACHE).
+RESPONSE_GENERATION_KEY = 'response_generation'
+
+
+def get_catalogue_version(catalogue, cached=True):
+    """Возвращает текущую версию справочника.
+
+    Версия хранится в таблице CatalogueVersion (общей для всех воркеров) и
+    кэшируется на CATALOGUE_VERSION_TIMEOUT секунд.
+
+    Args:
+        catalogue (str): название справочника (TAGS, INGREDIENTS или
+        RECIPES).
+        cached (bool, опционально): можно ли взять версию из кэша. Если
+        False, версия читается из базы. По умолчанию True.
+
+    Returns:
+        tuple: версия справочника (int) и время ее изменения (datetime).
+    """
+
+    key = CATALOGUE_VERSION_KEY.format(catalogue=catalogue)
+    version = cache.get(key) if cached else None
+    if version is None:
+        catalogue_version, _ = CatalogueVersion.objects.get_or_create(
+            name=catalogue, defaults={'updated_at': timezone.now()}
+        )
+        version = (catalogue_version.version, catalogue_version.updated_at)
+        cache.set(key, version, CATALOGUE_VERSION_TIMEOUT)
+    return version
+
+
+class CatalogueBumps:
+    """Справочники, измененные в текущей транзакции.
+
+    Вызывается один раз после фиксации транзакции (transaction.on_commit) и
+    меняет версии всех справочников одним запросом UPDATE.
+    """
+
+    def __init__(self, catalogue):
+        self.catalogues = {catalogue}
+
+    def __call__(self):
+        catalogues = set(self.catalogues)
+        if RECIPES in catalogues and settings.RESPONSE_SHARED_CACHE:
+            # Поколение ответов хранится только в общем кэше.
+            catalogues.discard(RECIPES)
+            bump_response_generation()
+        if not catalogues:
+            return
+        now = timezone.now()
+        updated = CatalogueVersion.objects.filter(
+            name__in=catalogues
+        ).update(version=F('version') + 1, updated_at=now)
+        if updated < len(catalogues):
+            for catalogue in catalogues:
+                CatalogueVersion.objects.get_or_create(
+                    name=catalogue, defaults={'updated_at': now}
+                )
+        cache.delete_many([
+            CATALOGUE_VERSION_KEY.format(catalogue=catalogue)
+            for catalogue in catalogues
+        ])
+
+
+def bump_catalogue_version(catalogue):
+    """Меняет версию справочника после изменения его данных.
+
+    Версия меняется после фиксации транзакции, один раз за транзакцию,
+    сколько бы раз справочник в ней ни менялся (см. CatalogueBumps): запись
+    не блокирует строку CatalogueVersion до конца транзакции. Вне
+    транзакции версия меняется сразу.
+
+    Args:
+        catalogue (str): название справочника (TAGS, INGREDIENTS или
+        RECIPES).
+    """
+
+    connection = transaction.get_connection()
+    # Колбэки отмененной транзакции (или точки сохранения) Django удаляет
+    # из run_on_commit, поэтому ищется только колбэк текущей транзакции.
+    bumps = next((
+        callback for _, callback in connection.run_on_commit
+        if isinstance(callback, CatalogueBumps)
+    ), None) if connection.in_atomic_block else None
+    if bumps is not None:
+        bumps.catalogues.add(catalogue)
+        return
+    transaction.on_commit(CatalogueBumps(catalogue))
+
+
+def get_response_generation():
+    """Возвращает поколение закэшированных ответов с рецептами.
+
+    С общим для воркеров кэшем (settings.RESPONSE_SHARED_CACHE) это
+    счетчик в кэше Django, и база не читается и не меняется. Иначе это
+    версия RECIPES из базы: счетчик в кэше одного воркера не узнает об
+    изменениях, сделанных другими воркерами.
+
+    Returns:
+        int: поколение.
+    """
+
+    if not settings.RESPONSE_SHARED_CACHE:
+        return get_catalogue_version(RECIPES, cached=False)[0]
+    generation = cache.get(RESPONSE_GENERATION_KEY)
+    if generation is None:
+        # Начальное значение случайное: если ключ вытеснен из кэша, новое
+        # поколение не совпадет с прежними.
+        generation = uuid4().int >> 65
+        if not cache.add(RESPONSE_GENERATION_KEY, generation, None):
+            generation = cache.get(RESPONSE_GENERATION_KEY, generation)
+    return generation
+
+
+def bump_response_generation():
+    """Увеличивает счетчик поколения ответов с рецептами (cache.incr)."""
+
+    try:
+        cache.incr(RESPONSE_GENERATION_KEY)
+    except ValueError:
+        # Счетчика нет в кэше: следующий запрос начнет новое поколение.
+        pass
@@ -0,0 +1,288 @@
+import hashlib
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .catalogue import RECIPES, bump_catalogue_version
+from .models import Recipe, RecipeImageVariant
+
+logger = logging.getLogger(__name__)
+
+# Размеры копий картинки рецепта: название, ширина, высота.
+VARIANT_SIZES = (
+    (RecipeImageVariant.CARD, 480, 360),
+    (RecipeImageVariant.DETAIL, 960, 720),
+    (RecipeImageVariant.RETINA, 1920, 1440),
+)
+# Форматы копий: формат Pillow, расширение файла, параметры сохранения.
+VARIANT_FORMATS = {
+    RecipeImageVariant.JPEG: ('JPEG', 'jpg', {
+        'quality': 82, 'optimize': True, 'progressive': True
+    }),
+    RecipeImageVariant.WEBP: ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+# Количество потоков, в которых копии создаются после сохранения рецептов.
+IMAGE_WORKERS = 2
+# Наибольшая сторона сохраняемой картинки рецепта: картинки больше
+# уменьшаются при загрузке.
+MAX_IMAGE_SIDE = 2560
+ORIENTATION_TAG = 0x0112
+
+executor = ThreadPoolExecutor(
+    max_workers=IMAGE_WORKERS, thread_name_prefix='recipe-images'
+)
+# Рецепты, копии картинок которых ждут в очереди или создаются: рецепт
+# обрабатывается одним потоком, повторная постановка в очередь во время
+# обработки (RERUN) перезапускает ее после окончания.
+QUEUED = 'queued'
+RUNNING = 'running'
+RERUN = 'rerun'
+pending = {}
+pending_lock = threading.Lock()
+
+
+def get_image_file_name(file):
+    """Возвращает случайное имя файла картинки с расширением по ее формату.
+
+    Читается только заголовок картинки.
+
+    Args:
+        file (File): загруженный файл.
+
+    Raises:
+        OSError: ошибка если файл не является картинкой.
+
+    Returns:
+        str: имя файла.
+    """
+
+    file.seek(0)
+    image_format = Image.open(file).format
+    file.seek(0)
+    extension = 'jpg' if image_format == 'JPEG' else image_format.lower()
+    return f'{uuid.uuid4()}.{extension}'
+
+
+def prepare_recipe_image(file):
+    """Уменьшает загруженную картинку рецепта, если она слишком большая.
+
+    Картинка с наибольшей стороной до MAX_IMAGE_SIDE и без поворота в EXIF
+    сохраняется как есть. Иначе она декодируется сразу в уменьшенном виде
+    (Image.draft для JPEG, reducing_gap для остальных форматов), поэтому
+    полноразмерное изображение не загружается в память целиком.
+
+    Args:
+        file (File): загруженный файл, прошедший проверку ImageField.
+
+    Returns:
+        File: исходный файл или уменьшенная копия в JPEG (PNG для картинок
+        с прозрачностью).
+    """
+
+    file.seek(0)
+    image = Image.open(file)
+    orientation = image.getexif().get(ORIENTATION_TAG, 1)
+    if max(image.size) <= MAX_IMAGE_SIDE and orientation == 1:
+        file.seek(0)
+        return file
+    box = (MAX_IMAGE_SIDE, MAX_IMAGE_SIDE)
+    image.draft('RGB', box)
+    image.thumbnail(box, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    image = ImageOps.exif_transpose(image)
+    content = BytesIO()
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image.save(content, 'PNG', optimize=True)
+        extension = 'png'
+    else:
+        image.convert('RGB').save(
+            content, 'JPEG', quality=88, optimize=True, progressive=True
+        )
+        extension = 'jpg'
+    return ContentFile(content.getvalue(), name=f'{uuid.uuid4()}.{extension}')
+
+
+def get_variant_size(width, height, box_width, box_height):
+    """Возвращает размер копии картинки.
+
+    Копия имеет пропорции рамки и не больше исходной картинки.
+
+    Args:
+        width (int): ширина исходной картинки.
+        height (int): высота исходной картинки.
+        box_width (int): ширина рамки.
+        box_height (int): высота рамки.
+
+    Returns:
+        tuple: ширина и высота копии.
+    """
+
+    scale = min(1, width / box_width, height / box_height)
+    return (
+        max(1, round(box_width * scale)),
+        max(1, round(box_height * scale))
+    )
+
+
+def render_variants(image_name):
+    """Создает копии картинки всех размеров и форматов.
+
+    Не обращается к базе, поэтому может выполняться в отдельном процессе.
+
+    Args:
+        image_name (str): путь до картинки в хранилище.
+
+    Returns:
+        list: список кортежей (размер, формат, ширина, высота, содержимое
+        файла).
+    """
+
+    with default_storage.open(image_name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA'))
+        image = background
+    variants = []
+    for name, box_width, box_height in VARIANT_SIZES:
+        size = get_variant_size(*image.size, box_width, box_height)
+        variant = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+        for variant_format, (pil_format, _, options) in (
+            VARIANT_FORMATS.items()
+        ):
+            content = BytesIO()
+            variant.save(content, pil_format, **options)
+            variants.append(
+                (name, variant_format, *size, content.getvalue())
+            )
+    return variants
+
+
+def save_variants(recipe, source, variants):
+    """Сохраняет копии картинки рецепта, заменяя прежние.
+
+    Args:
+        recipe (Recipe): объект рецепта.
+        source (str): путь до картинки, из которой сделаны копии.
+        variants (list): результат render_variants.
+    """
+
+    suffix = hashlib.md5(source.encode()).hexdigest()[:8]
+    with transaction.atomic():
+        recipe.image_variants.all().delete()
+        for name, variant_format, width, height, content in variants:
+            extension = VARIANT_FORMATS[variant_format][1]
+            variant = RecipeImageVariant(
+                recipe=recipe,
+                name=name,
+                format=variant_format,
+                width=width,
+                height=height,
+                source=source
+            )
+            variant.image.save(
+                f'{recipe.id}_{name}_{suffix}.{extension}',
+                ContentFile(content),
+                save=False
+            )
+            variant.save()
+        bump_catalogue_version(RECIPES)
+
+
+def is_outdated(recipe):
+    """Проверяет, нужно ли пересоздать копии картинки рецепта.
+
+    Args:
+        recipe (Recipe): объект рецепта.
+
+    Returns:
+        bool: True если копий нет или они сделаны из другой картинки.
+    """
+
+    sources = list(recipe.image_variants.values_list('source', flat=True))
+    return (
+        len(sources) != len(VARIANT_SIZES) * len(VARIANT_FORMATS)
+        or any(source != recipe.image.name for source in sources)
+    )
+
+
+def generate_image_variants(recipe_id, force=False):
+    """Создает копии картинки рецепта, если они устарели.
+
+    Args:
+        recipe_id (int): id рецепта.
+        force (bool, опционально): пересоздать копии, даже если они
+        актуальны. По умолчанию False.
+    """
+
+    recipe = Recipe.objects.filter(id=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    if force or is_outdated(recipe):
+        save_variants(
+            recipe, recipe.image.name, render_variants(recipe.image.name)
+        )
+
+
+def run_in_background(recipe_id):
+    """Создает копии картинки рецепта в потоке executor.
+
+    Если за время работы рецепт снова поставлен в очередь, копии
+    проверяются еще раз.
+    """
+
+    close_old_connections()
+    try:
+        while True:
+            with pending_lock:
+                pending[recipe_id] = RUNNING
+            try:
+                generate_image_variants(recipe_id)
+            except Exception:
+                logger.exception(
+                    'Image variants of recipe %s failed', recipe_id
+                )
+            with pending_lock:
+                if pending[recipe_id] != RERUN:
+                    del pending[recipe_id]
+                    break
+    finally:
+        close_old_connections()
+
+
+def submit_image_variants(recipe_id):
+    """Передает рецепт в executor, если он еще не ждет в очереди.
+
+    Args:
+        recipe_id (int): id рецепта.
+    """
+
+    with pending_lock:
+        state = pending.get(recipe_id)
+        if state == RUNNING:
+            pending[recipe_id] = RERUN
+        if state is not None:
+            return
+        pending[recipe_id] = QUEUED
+    executor.submit(run_in_background, recipe_id)
+
+
+def schedule_image_variants(recipe_id):
+    """Ставит создание копий картинки рецепта в очередь.
+
+    Копии создаются в фоновом потоке после фиксации транзакции, поэтому
+    запрос на сохранение рецепта их не ждет. Один рецепт не обрабатывается
+    двумя потоками одновременно (см. submit_image_variants).
+
+    Args:
+        recipe_id (int): id рецепта.
+    """
+
+    transaction.on_commit(lambda: submit_image_variants(recipe_id))
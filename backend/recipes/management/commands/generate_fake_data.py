@@ -0,0 +1,422 @@
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+from recipes.catalogue import (INGREDIENTS, RECIPES, TAGS,
+                               bump_catalogue_version)
+from recipes.models import (COLOR_CHOICES, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag, get_tag_bit)
+from users.models import Subscribe, User
+
+BATCH_SIZE = 5000
+SEED = 42
+FAKE_PASSWORD = 'fake-password'
+FAKE_IMAGE = 'recipes/fake_data.jpg'
+FAKE_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+    ('Десерт', 'dessert'),
+    ('Выпечка', 'bakery'),
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'соус', 'каша', 'рагу', 'запеканка', 'омлет',
+    'блины', 'котлеты', 'паста', 'плов', 'борщ', 'щи', 'жаркое', 'гратен',
+    'домашний', 'быстрый', 'острый', 'сливочный', 'овощной', 'куриный',
+    'грибной', 'рыбный', 'летний', 'зимний', 'праздничный', 'бабушкин',
+    'нарезать', 'обжарить', 'добавить', 'перемешать', 'посолить', 'тушить',
+    'запечь', 'остудить', 'подавать', 'минут', 'на', 'среднем', 'огне',
+    'с', 'зеленью', 'сметаной', 'чесноком', 'луком', 'сыром', 'до',
+    'готовности', 'и', 'в', 'духовке', 'сковороде', 'кастрюле',
+)
+# Показатель степени распределения Ципфа: популярность элемента с номером
+# k пропорциональна 1 / k ** ZIPF_EXPONENT.
+ZIPF_EXPONENT = 1.1
+
+
+def get_zipf_weights(size):
+    """Возвращает накопленные веса распределения Ципфа для random.choices.
+
+    Args:
+        size (int): количество элементов.
+
+    Returns:
+        list: накопленные веса элементов по убыванию популярности.
+    """
+
+    return list(accumulate(
+        1 / rank ** ZIPF_EXPONENT for rank in range(1, size + 1)
+    ))
+
+
+class ZipfSampler:
+    """Выбирает элементы с популярностью по закону Ципфа.
+
+    Популярность назначается элементам в случайном порядке, чтобы она не
+    зависела от id.
+    """
+
+    def __init__(self, rng, population):
+        self.rng = rng
+        self.population = list(population)
+        rng.shuffle(self.population)
+        self.weights = get_zipf_weights(len(self.population))
+
+    def sample(self, count):
+        """Возвращает до count разных элементов.
+
+        Args:
+            count (int): сколько элементов выбрать.
+
+        Returns:
+            set: выбранные элементы.
+        """
+
+        count = min(count, len(self.population))
+        if not count:
+            return set()
+        return set(self.rng.choices(
+            self.population, cum_weights=self.weights, k=count
+        ))
+
+
+@contextmanager
+def keep_pub_dates():
+    """Позволяет сохранить рецепты со своей датой публикации.
+
+    Поле pub_date заполняется автоматически (auto_now_add) в том числе в
+    bulk_create, поэтому на время генерации это отключается.
+    """
+
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def get_batches(items, batch_size):
+    """Разбивает последовательность на пачки.
+
+    Args:
+        items (list): последовательность.
+        batch_size (int): размер пачки.
+
+    Yields:
+        list: пачка элементов.
+    """
+
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible fake dataset for performance testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Number of users to create'
+        )
+        parser.add_argument(
+            '--recipes', type=int, default=10000,
+            help='Number of recipes to create'
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Average number of ingredients in a recipe'
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Average number of favorite recipes per user'
+        )
+        parser.add_argument(
+            '--carts', type=float, default=3,
+            help='Average number of recipes in a shopping cart'
+        )
+        parser.add_argument(
+            '--subscriptions', type=float, default=10,
+            help='Average number of subscriptions per user'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Recipes are published during the last DAYS days'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=SEED,
+            help='Random seed (the same seed gives the same data)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of rows created per query batch'
+        )
+
+    def handle(self, *args, **options):
+        self.started = time.monotonic()
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not ingredient_ids:
+            raise CommandError('No ingredients, run load_data first')
+        tag_ids = self.create_tags()
+        user_ids = self.get_new_ids(User, options['users'])
+        recipe_ids = self.get_new_ids(Recipe, options['recipes'])
+        authors = ZipfSampler(self.rng, user_ids)
+        recipe_authors = self.rng.choices(
+            authors.population, cum_weights=authors.weights,
+            k=len(recipe_ids)
+        )
+        recipes = ZipfSampler(self.rng, recipe_ids)
+        favorites = self.get_pairs(user_ids, recipes, options['favorites'])
+        carts = self.get_pairs(user_ids, recipes, options['carts'])
+        self.log('Planned')
+        self.create_users(user_ids, Counter(recipe_authors))
+        self.create_recipes(
+            recipe_ids,
+            recipe_authors,
+            Counter(recipe_id for _, recipe_id in favorites),
+            Counter(recipe_id for _, recipe_id in carts),
+            ZipfSampler(self.rng, tag_ids),
+            ZipfSampler(self.rng, ingredient_ids),
+            options['ingredients_per_recipe'], options['days']
+        )
+        self.create_rows(Favorite, favorites, 'user_id', 'recipe_id')
+        self.create_rows(ShoppingCart, carts, 'user_id', 'recipe_id')
+        self.create_rows(
+            Subscribe,
+            self.get_pairs(
+                user_ids, ZipfSampler(self.rng, set(recipe_authors)),
+                options['subscriptions'], exclude_self=True
+            ),
+            'user_id', 'author_id'
+        )
+        self.reset_sequences()
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        for catalogue in (TAGS, INGREDIENTS, RECIPES):
+            bump_catalogue_version(catalogue)
+        self.log('Done')
+
+    def log(self, message):
+        """Выводит сообщение с временем от начала генерации.
+
+        Args:
+            message (str): сообщение.
+        """
+
+        self.stdout.write(
+            f'[{time.monotonic() - self.started:7.1f}s] {message}'
+        )
+
+    def get_new_ids(self, model, count):
+        """Возвращает id для новых объектов модели.
+
+        id назначаются заранее, чтобы связывать объекты без чтения из базы
+        (bulk_create на SQLite не возвращает id).
+
+        Args:
+            model (Model): класс модели.
+            count (int): количество объектов.
+
+        Returns:
+            list: список id.
+        """
+
+        start = (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        return list(range(start, start + count))
+
+    def get_pairs(self, user_ids, sampler, mean, exclude_self=False):
+        """Выбирает каждому пользователю объекты популярных авторов или
+        рецептов.
+
+        Количество объектов у пользователя распределено экспоненциально со
+        средним mean, сами объекты выбираются по закону Ципфа.
+
+        Args:
+            user_ids (list): id пользователей.
+            sampler (ZipfSampler): выбор объектов.
+            mean (float): среднее количество объектов у пользователя.
+            exclude_self (bool, опционально): исключить id самого
+            пользователя (для подписок). По умолчанию False.
+
+        Returns:
+            list: пары (id пользователя, id объекта).
+        """
+
+        if mean <= 0:
+            return []
+        pairs = []
+        for user_id in user_ids:
+            chosen = sampler.sample(int(self.rng.expovariate(1 / mean)))
+            if exclude_self:
+                chosen.discard(user_id)
+            pairs.extend((user_id, item) for item in sorted(chosen))
+        return pairs
+
+    def create_tags(self):
+        """Создает недостающие теги (по одному на каждый свободный цвет).
+
+        Returns:
+            list: id всех тегов.
+        """
+
+        used_colors = set(Tag.objects.values_list('color', flat=True))
+        used_slugs = set(Tag.objects.values_list('slug', flat=True))
+        colors = [
+            color for color, _ in COLOR_CHOICES if color not in used_colors
+        ]
+        Tag.objects.bulk_create(
+            Tag(name=name, slug=slug, color=color)
+            for (name, slug), color in zip(
+                (tag for tag in FAKE_TAGS if tag[1] not in used_slugs),
+                colors
+            )
+        )
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def create_users(self, user_ids, recipes_count):
+        """Создает пользователей с общим паролем FAKE_PASSWORD.
+
+        Args:
+            user_ids (list): id новых пользователей.
+            recipes_count (Counter): количество рецептов у каждого автора.
+        """
+
+        password = make_password(FAKE_PASSWORD)
+        for batch in get_batches(user_ids, self.batch_size):
+            User.objects.bulk_create(
+                User(
+                    id=user_id,
+                    username=f'fake_user_{user_id}',
+                    email=f'fake_user_{user_id}@example.com',
+                    first_name=self.rng.choice(('Анна', 'Иван', 'Мария')),
+                    last_name=self.rng.choice(('Петрова', 'Смирнов')),
+                    password=password,
+                    recipes_count=recipes_count[user_id]
+                ) for user_id in batch
+            )
+        self.log(f'Users: {len(user_ids)}')
+
+    def get_words(self, low, high):
+        """Возвращает от low до high случайных слов через пробел."""
+
+        return ' '.join(
+            self.rng.choice(WORDS) for _ in range(self.rng.randint(low, high))
+        )
+
+    def create_recipes(self, recipe_ids, recipe_authors, favorites_count,
+                       cart_count, tags, ingredients, ingredients_per_recipe,
+                       days):
+        """Создает рецепты с тегами и ингредиентами.
+
+        Денормализованные поля (счетчики и маска тегов) заполняются сразу,
+        даты публикации растут вместе с id.
+
+        Args:
+            recipe_ids (list): id новых рецептов.
+            recipe_authors (list): id автора каждого рецепта.
+            favorites_count (Counter): количество добавлений в избранное.
+            cart_count (Counter): количество добавлений в список покупок.
+            tags (ZipfSampler): выбор тегов.
+            ingredients (ZipfSampler): выбор ингредиентов.
+            ingredients_per_recipe (int): среднее количество ингредиентов.
+            days (int): за сколько последних дней опубликованы рецепты.
+        """
+
+        if not default_storage.exists(FAKE_IMAGE):
+            image = BytesIO()
+            Image.new('RGB', (960, 720), (230, 160, 90)).save(image, 'JPEG')
+            default_storage.save(FAKE_IMAGE, ContentFile(image.getvalue()))
+        start = timezone.now() - timedelta(days=days)
+        step = timedelta(days=days) / max(len(recipe_ids), 1)
+        authors = dict(zip(recipe_ids, recipe_authors))
+        created = 0
+        with keep_pub_dates():
+            for batch in get_batches(recipe_ids, self.batch_size):
+                recipes, recipe_tags, recipe_ingredients = [], [], []
+                for recipe_id in batch:
+                    chosen_tags = tags.sample(self.rng.choice((1, 1, 2, 3)))
+                    recipe_tags.extend(
+                        Recipe.tags.through(
+                            recipe_id=recipe_id, tag_id=tag_id
+                        ) for tag_id in chosen_tags
+                    )
+                    recipe_ingredients.extend(
+                        RecipeIngredient(
+                            recipe_id=recipe_id,
+                            ingredient_id=ingredient_id,
+                            amount=self.rng.randint(1, 500)
+                        ) for ingredient_id in ingredients.sample(round(
+                            self.rng.triangular(
+                                1, 2 * ingredients_per_recipe
+                            )
+                        ))
+                    )
+                    recipes.append(Recipe(
+                        id=recipe_id,
+                        author_id=authors[recipe_id],
+                        name=self.get_words(2, 4).capitalize(),
+                        text=self.get_words(20, 60),
+                        image=FAKE_IMAGE,
+                        cooking_time=self.rng.randint(5, 180),
+                        pub_date=start + step * (
+                            recipe_id - recipe_ids[0] + self.rng.random()
+                        ),
+                        favorites_count=favorites_count[recipe_id],
+                        cart_count=cart_count[recipe_id],
+                        tags_mask=sum(map(get_tag_bit, chosen_tags))
+                    ))
+                with transaction.atomic():
+                    Recipe.objects.bulk_create(recipes)
+                    Recipe.tags.through.objects.bulk_create(recipe_tags)
+                    RecipeIngredient.objects.bulk_create(recipe_ingredients)
+                created += len(batch)
+                self.log(f'Recipes: {created}/{len(recipe_ids)}')
+
+    def create_rows(self, model, pairs, first_field, second_field):
+        """Создает связи (избранное, списки покупок, подписки) пачками.
+
+        Args:
+            model (Model): класс модели связи.
+            pairs (list): пары id.
+            first_field (str): поле для первого id пары.
+            second_field (str): поле для второго id пары.
+        """
+
+        for batch in get_batches(pairs, self.batch_size):
+            model.objects.bulk_create(
+                (
+                    model(**{first_field: first, second_field: second})
+                    for first, second in batch
+                ),
+                ignore_conflicts=True
+            )
+        self.log(f'{model.__name__}: {len(pairs)}')
+
+    def reset_sequences(self):
+        """Сдвигает счетчики id после вставки объектов с явными id
+        (нужно для PostgreSQL).
+        """
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Recipe]
+            ):
+                cursor.execute(sql)
@@ -0,0 +1,88 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from recipes.images import (VARIANT_FORMATS, VARIANT_SIZES, render_variants,
+                            save_variants)
+from recipes.models import Recipe, RecipeImageVariant
+
+BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail and WebP variants of recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Number of worker processes resizing images'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of recipes processed per batch'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerate variants that are already up to date'
+        )
+
+    def handle(self, *args, **options):
+        # Рабочие процессы не обращаются к базе, но при fork наследуют
+        # открытые соединения, поэтому они закрываются заранее.
+        connections.close_all()
+        generated = failed = 0
+        with ProcessPoolExecutor(options['processes']) as executor:
+            for recipes in self.get_batches(
+                options['batch_size'], options['force']
+            ):
+                futures = [
+                    executor.submit(render_variants, recipe.image.name)
+                    for recipe in recipes
+                ]
+                for recipe, future in zip(recipes, futures):
+                    try:
+                        variants = future.result()
+                    except Exception as error:
+                        failed += 1
+                        self.stderr.write(f'Recipe {recipe.id}: {error}')
+                        continue
+                    save_variants(recipe, recipe.image.name, variants)
+                    generated += 1
+        self.stdout.write(
+            f'Generated variants: {generated}, failed: {failed}'
+        )
+
+    def get_batches(self, batch_size, force):
+        """Возвращает пачки рецептов, копии картинок которых устарели.
+
+        Args:
+            batch_size (int): количество рецептов в пачке.
+            force (bool): возвращать и рецепты с актуальными копиями.
+
+        Yields:
+            list: список рецептов.
+        """
+
+        expected = len(VARIANT_SIZES) * len(VARIANT_FORMATS)
+        last_id = 0
+        while True:
+            batch = list(Recipe.objects.filter(id__gt=last_id).exclude(
+                image=''
+            ).order_by('id').only('id', 'image')[:batch_size])
+            if not batch:
+                return
+            last_id = batch[-1].id
+            if not force:
+                sources = defaultdict(list)
+                for recipe_id, source in RecipeImageVariant.objects.filter(
+                    recipe__in=batch
+                ).values_list('recipe_id', 'source'):
+                    sources[recipe_id].append(source)
+                batch = [
+                    recipe for recipe in batch
+                    if sources[recipe.id] != [recipe.image.name] * expected
+                ]
+            if batch:
+                yield batch
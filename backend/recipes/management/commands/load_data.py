@@ -1,23 +1,248 @@
 import csv
+import io
+import json
 import os
+import time
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 from foodgram.settings import BASE_DIR
+from recipes.catalogue import INGREDIENTS, bump_catalogue_version
 from recipes.models import Ingredient
 
 FILE = os.path.join(BASE_DIR, 'data', 'ingredients.csv')
+FORMATS = ('csv', 'json')
+BATCH_SIZE = 5000
+# Сколько символов JSON читается из файла за раз.
+JSON_CHUNK_SIZE = 64 * 1024
+STAGING_TABLE = 'recipes_ingredient_staging'
+
+
+def read_csv(file):
+    """Построчно читает ингредиенты из csv (название, единица измерения).
+
+    Args:
+        file (file): открытый файл.
+
+    Yields:
+        tuple: название и единица измерения.
+    """
+
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+        elif any(row):
+            yield row[0], ''
+
+
+def read_json(file):
+    """Читает ингредиенты из JSON-массива объектов, не загружая файл целиком.
+
+    Объекты массива разбираются по одному по мере чтения файла кусками по
+    JSON_CHUNK_SIZE символов.
+
+    Args:
+        file (file): открытый файл.
+
+    Raises:
+        CommandError: ошибка если файл не является массивом объектов с
+        полями name и measurement_unit.
+
+    Yields:
+        tuple: название и единица измерения.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON file must contain an array of objects')
+    buffer, position, eof = buffer[1:], 0, False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Invalid JSON file')
+            chunk = file.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        if not isinstance(item, dict):
+            raise CommandError('JSON file must contain an array of objects')
+        yield item.get('name', ''), item.get('measurement_unit', '')
+        position = end
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def clean_rows(rows, stats):
+    """Убирает лишние пробелы и пропускает некорректные строки.
+
+    Args:
+        rows (iterable): пары (название, единица измерения).
+        stats (dict): счетчики read и skipped.
+
+    Yields:
+        tuple: название и единица измерения.
+    """
+
+    name_length = Ingredient._meta.get_field('name').max_length
+    unit_length = Ingredient._meta.get_field('measurement_unit').max_length
+    for name, measurement_unit in rows:
+        stats['read'] += 1
+        name = str(name or '').strip()
+        measurement_unit = str(measurement_unit or '').strip()
+        if (
+            not name or not measurement_unit
+            or len(name) > name_length
+            or len(measurement_unit) > unit_length
+        ):
+            stats['skipped'] += 1
+            continue
+        yield name, measurement_unit
+
+
+def get_batches(rows, batch_size):
+    """Разбивает строки на пачки.
+
+    Args:
+        rows (iterable): строки.
+        batch_size (int): размер пачки.
+
+    Yields:
+        list: пачка строк.
+    """
+
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def upsert_batch(batch):
+    """Добавляет ингредиенты пачки, которых еще нет в базе.
+
+    Ингредиент однозначно определяется названием и единицей измерения
+    (ограничение ingredient_unique), других полей у него нет, поэтому
+    повторная загрузка просто пропускает существующие ингредиенты.
+
+    Args:
+        batch (list): пары (название, единица измерения).
+    """
+
+    Ingredient.objects.bulk_create(
+        (
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in batch
+        ),
+        ignore_conflicts=True
+    )
+
+
+def copy_batch(cursor, batch):
+    """Загружает пачку через COPY во временную таблицу (PostgreSQL).
+
+    Из временной таблицы новые ингредиенты переносятся одним запросом
+    INSERT ... ON CONFLICT DO NOTHING.
+
+    Args:
+        cursor (CursorWrapper): курсор соединения с базой.
+        batch (list): пары (название, единица измерения).
+    """
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(batch)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f'COPY {STAGING_TABLE} (name, measurement_unit) '
+        'FROM STDIN WITH (FORMAT csv)',
+        buffer
+    )
+    cursor.execute(
+        f'INSERT INTO {Ingredient._meta.db_table} (name, measurement_unit) '
+        f'SELECT DISTINCT name, measurement_unit FROM {STAGING_TABLE} '
+        'ON CONFLICT (name, measurement_unit) DO NOTHING'
+    )
+    cursor.execute(f'TRUNCATE {STAGING_TABLE}')
 
 
 class Command(BaseCommand):
-    help = 'Load ingredients'
+    help = 'Load ingredients from csv or json files'
 
-    def handle(self, *args, **options):
-        table = csv.reader(
-            open(FILE, encoding='utf-8'), delimiter=','
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files', nargs='*', default=[FILE],
+            help='Files to load (by default data/ingredients.csv)'
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='File format (by default taken from the file extension)'
         )
-        Ingredient.objects.bulk_create(
-            Ingredient(
-                name=row[0],
-                measurement_unit=row[1]
-            ) for row in list(table)
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of ingredients saved per batch'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+        stats = {'read': 0, 'skipped': 0}
+        count = Ingredient.objects.count()
+        started = time.monotonic()
+        for path in options['files']:
+            file_format = (
+                options['format']
+                or os.path.splitext(path)[1].lstrip('.').lower()
+            )
+            if file_format not in READERS:
+                raise CommandError(f'Unknown format of {path}')
+            with open(path, encoding='utf-8', newline='') as file:
+                self.load(
+                    clean_rows(READERS[file_format](file), stats), batch_size
+                )
+        elapsed = time.monotonic() - started
+        created = Ingredient.objects.count() - count
+        if created:
+            bump_catalogue_version(INGREDIENTS)
+        self.stdout.write(
+            f'Read: {stats["read"]}, skipped: {stats["skipped"]}, '
+            f'created: {created} in {elapsed:.2f}s '
+            f'({stats["read"] / max(elapsed, 1e-6):.0f} rows/s)'
         )
+
+    def load(self, rows, batch_size):
+        """Загружает строки в базу пачками по batch_size.
+
+        Каждая пачка сохраняется в своей транзакции: прерванную загрузку
+        можно просто запустить заново.
+
+        Args:
+            rows (iterable): пары (название, единица измерения).
+            batch_size (int): размер пачки.
+        """
+
+        if connection.vendor != 'postgresql':
+            for batch in get_batches(rows, batch_size):
+                with transaction.atomic():
+                    upsert_batch(batch)
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} '
+                '(name varchar(200), measurement_unit varchar(200))'
+            )
+            for batch in get_batches(rows, batch_size):
+                with transaction.atomic():
+                    copy_batch(cursor, batch)
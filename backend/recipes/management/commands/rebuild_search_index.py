@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+from recipes.search import update_search_index
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of recipes indexed per batch'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        indexed = 0
+        while True:
+            batch = list(Recipe.objects.filter(
+                id__gt=last_id
+            ).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            update_search_index(batch)
+            last_id = batch[-1]
+            indexed += len(batch)
+        self.stdout.write(f'Indexed recipes: {indexed}')
@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Verify shopping lists against shopping carts and rebuild them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of users checked per query'
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report users with outdated shopping lists'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = sorted(
+            set(ShoppingCart.objects.values_list('user_id', flat=True))
+            | set(ShoppingListItem.objects.values_list('user_id', flat=True))
+        )
+        outdated = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            actual = self.get_actual_items(batch)
+            stored = {
+                (user_id, ingredient_id): total_amount
+                for user_id, ingredient_id, total_amount
+                in ShoppingListItem.objects.filter(user__in=batch).values_list(
+                    'user_id', 'ingredient_id', 'total_amount'
+                )
+            }
+            users = {
+                user_id for user_id, ingredient_id in set(actual) | set(stored)
+                if actual.get((user_id, ingredient_id))
+                != stored.get((user_id, ingredient_id))
+            }
+            outdated += len(users)
+            if users and not options['check']:
+                self.rebuild(users, actual)
+        action = 'found' if options['check'] else 'rebuilt'
+        self.stdout.write(f'Outdated shopping lists {action}: {outdated}')
+
+    def get_actual_items(self, user_ids):
+        """Возвращает сводные списки покупок, посчитанные по рецептам.
+
+        Args:
+            user_ids (list): список id пользователей.
+
+        Returns:
+            dict: словарь {(id пользователя, id ингредиента): количество}.
+        """
+
+        return {
+            (item['recipe__shopping_cart__user'], item['ingredient']):
+                item['total_amount']
+            for item in RecipeIngredient.objects.filter(
+                recipe__shopping_cart__user__in=user_ids
+            ).values('recipe__shopping_cart__user', 'ingredient').annotate(
+                total_amount=Sum('amount')
+            ).order_by()
+        }
+
+    @transaction.atomic
+    def rebuild(self, user_ids, actual):
+        """Пересоздает сводные списки покупок пользователей.
+
+        Args:
+            user_ids (set): id пользователей с устаревшими списками.
+            actual (dict): актуальные количества (см. get_actual_items).
+        """
+
+        ShoppingListItem.objects.filter(user__in=user_ids).delete()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=total_amount
+            ) for (user_id, ingredient_id), total_amount in actual.items()
+            if user_id in user_ids
+        )
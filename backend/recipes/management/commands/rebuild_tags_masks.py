@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from recipes.models import Recipe
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the tag bitmasks of recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of recipes updated per batch'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        updated = 0
+        while True:
+            batch = list(Recipe.objects.filter(
+                id__gt=last_id
+            ).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            Recipe.update_tags_masks(batch)
+            last_id = batch[-1]
+            updated += len(batch)
+        self.stdout.write(f'Updated recipes: {updated}')
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import User
+
+BATCH_SIZE = 1000
+
+
+def count_subquery(model, field):
+    """Возвращает подзапрос, считающий связанные объекты.
+
+    Args:
+        model (Model): класс связанной модели.
+        field (str): поле связанной модели, ссылающееся на объект.
+
+    Returns:
+        Coalesce: количество связанных объектов (0 если их нет).
+    """
+
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recount and repair denormalized counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of rows checked per query'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        counters = (
+            (Recipe, 'favorites_count', Favorite, 'recipe'),
+            (Recipe, 'cart_count', ShoppingCart, 'recipe'),
+            (User, 'recipes_count', Recipe, 'author'),
+        )
+        for model, field, related_model, related_field in counters:
+            repaired = self.recount(
+                model, field, related_model, related_field, batch_size
+            )
+            self.stdout.write(
+                f'{model.__name__}.{field}: repaired {repaired}'
+            )
+
+    def recount(self, model, field, related_model, related_field,
+                batch_size):
+        """Пересчитывает счетчик пачками по id и исправляет расхождения
+        одним запросом UPDATE с подзапросом на пачку.
+
+        Args:
+            model (Model): класс модели со счетчиком.
+            field (str): название поля счетчика.
+            related_model (Model): класс подсчитываемой модели.
+            related_field (str): поле подсчитываемой модели, ссылающееся на
+            объект со счетчиком.
+            batch_size (int): количество объектов в пачке.
+
+        Returns:
+            int: количество исправленных объектов.
+        """
+
+        repaired = 0
+        last_id = 0
+        while True:
+            batch = list(model.objects.filter(
+                id__gt=last_id
+            ).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not batch:
+                return repaired
+            last_id = batch[-1]
+            actual = count_subquery(related_model, related_field)
+            repaired += model.objects.filter(id__in=batch).exclude(
+                **{field: actual}
+            ).update(**{field: actual})
@@ -0,0 +1,48 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:03
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    User = apps.get_model('users', 'User')
+    Recipe.objects.update(
+        favorites_count=count_subquery(Favorite, 'recipe'),
+        cart_count=count_subquery(ShoppingCart, 'recipe')
+    )
+    User.objects.update(recipes_count=count_subquery(Recipe, 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_auto_20220729_2333'),
+        ('users', '0002_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество добавлений в списки покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество добавлений в избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
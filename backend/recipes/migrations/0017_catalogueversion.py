@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_auto_20261018_0207'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Справочник')),
+                ('version', models.CharField(max_length=32, verbose_name='Версия')),
+                ('updated_at', models.DateTimeField(verbose_name='Время изменения')),
+            ],
+            options={
+                'verbose_name': 'Версия справочника',
+                'verbose_name_plural': 'Версии справочников',
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:11
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+INGREDIENTS_SQL = (
+    "(SELECT {aggregate} FROM recipes_recipeingredient "
+    "JOIN recipes_ingredient "
+    "ON recipes_ingredient.id = recipes_recipeingredient.ingredient_id "
+    "WHERE recipes_recipeingredient.recipe_id = recipes_recipe.id)"
+)
+POSTGRESQL_FORWARD = (
+    "CREATE INDEX recipes_recipe_search_vector_gin "
+    "ON recipes_recipe USING gin (search_vector)",
+    "UPDATE recipes_recipe SET search_vector = "
+    "setweight(to_tsvector('russian'::regconfig, name), 'A') || "
+    "setweight(to_tsvector('russian'::regconfig, COALESCE({}, '')), 'B') || "
+    "setweight(to_tsvector('russian'::regconfig, text), 'C')".format(
+        INGREDIENTS_SQL.format(
+            aggregate="string_agg(recipes_ingredient.name, ' ')"
+        )
+    ),
+)
+POSTGRESQL_BACKWARD = (
+    "DROP INDEX IF EXISTS recipes_recipe_search_vector_gin",
+)
+SQLITE_FOLD = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+SQLITE_FORWARD = (
+    "CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5("
+    "name, ingredients, text, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) "
+    "SELECT id, {}, {}, {} FROM recipes_recipe".format(
+        SQLITE_FOLD.format('name'),
+        SQLITE_FOLD.format("COALESCE({}, '')".format(INGREDIENTS_SQL.format(
+            aggregate="group_concat(recipes_ingredient.name, ' ')"
+        ))),
+        SQLITE_FOLD.format('text')
+    ),
+)
+SQLITE_BACKWARD = (
+    "DROP TABLE IF EXISTS recipes_recipe_fts",
+)
+
+
+def run_vendor_sql(postgresql, sqlite):
+    def run(apps, schema_editor):
+        statements = {
+            'postgresql': postgresql,
+            'sqlite': sqlite,
+        }.get(schema_editor.connection.vendor, ())
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_catalogueversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_vendor_sql(POSTGRESQL_FORWARD, SQLITE_FORWARD),
+            run_vendor_sql(POSTGRESQL_BACKWARD, SQLITE_BACKWARD)
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:15
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+TAGS_MASK_SIZE = 63
+
+
+def fill_tags_masks(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    masks = defaultdict(int)
+    for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+        'recipe_id', 'tag_id'
+    ).iterator():
+        if 0 < tag_id <= TAGS_MASK_SIZE:
+            masks[recipe_id] |= 1 << (tag_id - 1)
+    recipes = defaultdict(list)
+    for recipe_id, mask in masks.items():
+        recipes[mask].append(recipe_id)
+    for mask, ids in recipes.items():
+        Recipe.objects.filter(id__in=ids).update(tags_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Битовая маска тегов'),
+        ),
+        migrations.RunPython(fill_tags_masks, migrations.RunPython.noop),
+    ]
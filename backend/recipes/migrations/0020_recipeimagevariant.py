@@ -0,0 +1,36 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_recipe_tags_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(choices=[('card', 'Карточка'), ('detail', 'Страница рецепта'), ('retina', 'Retina')], max_length=10, verbose_name='Размер')),
+                ('format', models.CharField(choices=[('jpeg', 'JPEG'), ('webp', 'WebP')], max_length=10, verbose_name='Формат')),
+                ('image', models.ImageField(upload_to='recipes/variants/', verbose_name='Картинка')),
+                ('width', models.PositiveSmallIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveSmallIntegerField(verbose_name='Высота')),
+                ('source', models.CharField(max_length=100, verbose_name='Исходная картинка')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_variants', to='recipes.Recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Копия картинки рецепта',
+                'verbose_name_plural': 'Копии картинок рецептов',
+                'ordering': ('width',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipeimagevariant',
+            constraint=models.UniqueConstraint(fields=('recipe', 'name', 'format'), name='recipe_image_variant_unique'),
+        ),
+    ]
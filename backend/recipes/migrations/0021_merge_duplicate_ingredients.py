@@ -0,0 +1,63 @@
+# Generated by Django 2.2.28 on 2026-10-18 02:28
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+# Наибольшие значения полей количества (PositiveSmallIntegerField и
+# PositiveIntegerField): сумма количеств при объединении не выходит за них.
+AMOUNT_LIMITS = {'amount': 32767, 'total_amount': 2147483647}
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Объединяет ингредиенты с одинаковыми названием и единицей измерения.
+
+    Остается ингредиент с наименьшим id, строки рецептов и списков покупок
+    переносятся на него (количества складываются, но не больше
+    AMOUNT_LIMITS). Ограничение уникальности добавляется следующей
+    миграцией: на PostgreSQL ALTER TABLE нельзя выполнить в одной
+    транзакции с удалением строк, на которые есть внешние ключи.
+    """
+
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates:
+        keep_id = group['keep_id']
+        merged = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=keep_id)
+        for model, owner, amount in (
+            (RecipeIngredient, 'recipe_id', 'amount'),
+            (ShoppingListItem, 'user_id', 'total_amount'),
+        ):
+            for row in model.objects.filter(ingredient__in=merged):
+                kept = model.objects.filter(
+                    ingredient_id=keep_id, **{owner: getattr(row, owner)}
+                ).first()
+                if kept is None:
+                    row.ingredient_id = keep_id
+                    row.save()
+                    continue
+                setattr(kept, amount, min(
+                    getattr(kept, amount) + getattr(row, amount),
+                    AMOUNT_LIMITS[amount]
+                ))
+                kept.save()
+                row.delete()
+        merged.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_recipeimagevariant'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_ingredient_unique'),
+    ]
+
+    # Версии-строки (uuid4) не приводятся к числу: столбец создается
+    # заново, все справочники получают версию 0.
+    operations = [
+        migrations.RemoveField(
+            model_name='catalogueversion',
+            name='version',
+        ),
+        migrations.AddField(
+            model_name='catalogueversion',
+            name='version',
+            field=models.BigIntegerField(default=0, verbose_name='Версия'),
+        ),
+    ]
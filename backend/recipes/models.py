@@ -1,5 +1,10 @@
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
 from users.models import User
 
 BLUE = '#0000FF'
@@ -15,6 +20,49 @@ COLOR_CHOICES = [
     (PURPLE, 'Фиолетовый'),
     (YELLOW, 'Желтый'),
 ]
+# Количество битов маски тегов рецепта (BigIntegerField со знаком).
+TAGS_MASK_SIZE = 63
+
+
+def get_tag_bit(tag_id):
+    """Возвращает бит тега в маске тегов рецепта.
+
+    Args:
+        tag_id (int): id тега.
+
+    Returns:
+        int: бит тега или 0, если id тега не помещается в маску.
+    """
+
+    if 0 < tag_id <= TAGS_MASK_SIZE:
+        return 1 << (tag_id - 1)
+    return 0
+
+
+class CatalogueVersion(models.Model):
+    """Модель для версий справочников (тегов и ингредиентов).
+
+    Версия меняется при любом изменении справочника и используется для
+    условных GET-запросов (ETag, Last-Modified) и сброса кэшей.
+
+    Attributes:
+        name (str): название справочника.
+        version (int): текущая версия (увеличивается на 1 при изменении).
+        updated_at (datetime): время последнего изменения.
+    """
+
+    name = models.CharField('Справочник', max_length=50, unique=True)
+    version = models.BigIntegerField('Версия', default=0)
+    updated_at = models.DateTimeField('Время изменения')
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        """Возвращает строковое представление модели"""
+
+        return f'{self.name}: {self.version}'
 
 
 class RecipeIngredient(models.Model):
@@ -76,6 +124,12 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='ingredient_unique'
+            ),
+        ]
 
     def __str__(self):
         """Возвращает строковое представление модели"""
@@ -125,6 +179,11 @@ class Recipe(models.Model):
         RecipeIngredient).
         tags (int): теги (связь ManyToMany).
         author (int): id автора рецепта.
+        favorites_count (int): количество добавлений в избранное.
+        cart_count (int): количество добавлений в списки покупок.
+        search_vector (str): поисковый вектор для полнотекстового поиска
+        (только PostgreSQL, см. recipes.search).
+        tags_mask (int): битовая маска тегов рецепта (см. get_tag_bit).
     """
 
     name = models.CharField(
@@ -164,6 +223,30 @@ class Recipe(models.Model):
         on_delete=models.CASCADE,
         related_name='recipes'
     )
+    favorites_count = models.PositiveIntegerField(
+        'Количество добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    cart_count = models.PositiveIntegerField(
+        'Количество добавлений в списки покупок',
+        default=0,
+        editable=False
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    tags_mask = models.BigIntegerField(
+        'Битовая маска тегов',
+        default=0,
+        editable=False
+    )
+
+    DENORMALIZED_FIELDS = (
+        'favorites_count', 'cart_count', 'search_vector', 'tags_mask'
+    )
 
     class Meta:
         ordering = ('-pub_date',)
@@ -175,6 +258,128 @@ class Recipe(models.Model):
 
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Создает рецепт из строки базы и запоминает его автора и картинку
+        (по ним сигналы move_recipes_count и update_image_variants замечают
+        их изменение без запроса).
+        """
+
+        recipe = super().from_db(db, field_names, values)
+        recipe._loaded_author_id = recipe.__dict__.get('author_id')
+        recipe._loaded_image = recipe.__dict__.get('image')
+        return recipe
+
+    def save(self, *args, **kwargs):
+        """Сохраняет рецепт.
+
+        При изменении рецепта не перезаписывает поля DENORMALIZED_FIELDS:
+        они обновляются отдельными запросами (сигналы, поисковый индекс), и
+        значения в объекте могут быть устаревшими.
+        """
+
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DENORMALIZED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    def get_ingredient_amounts(self):
+        """Возвращает количество каждого ингредиента рецепта.
+
+        Returns:
+            dict: словарь {id ингредиента: количество}.
+        """
+
+        return dict(self.recipe_ingredients.values_list(
+            'ingredient_id', 'amount'
+        ))
+
+    @classmethod
+    def update_tags_masks(cls, recipe_ids):
+        """Пересчитывает битовые маски тегов рецептов.
+
+        Рецепты с одинаковой маской обновляются одним запросом.
+
+        Args:
+            recipe_ids (list): список id рецептов.
+        """
+
+        masks = dict.fromkeys(recipe_ids, 0)
+        if not masks:
+            return
+        for recipe_id, tag_id in cls.tags.through.objects.filter(
+            recipe_id__in=masks
+        ).values_list('recipe_id', 'tag_id'):
+            masks[recipe_id] |= get_tag_bit(tag_id)
+        recipes = defaultdict(list)
+        for recipe_id, mask in masks.items():
+            recipes[mask].append(recipe_id)
+        for mask, ids in recipes.items():
+            cls.objects.filter(id__in=ids).update(tags_mask=mask)
+
+
+class RecipeImageVariant(models.Model):
+    """Модель для уменьшенных копий картинки рецепта.
+
+    Копии создаются в фоне после сохранения рецепта (см. recipes.images).
+
+    Attributes:
+        recipe (int): id рецепта.
+        name (str): название размера (карточка, страница рецепта, retina).
+        format (str): формат файла (JPEG или WebP).
+        image (str): уменьшенная картинка (путь до нее).
+        width (int): ширина картинки в пикселях.
+        height (int): высота картинки в пикселях.
+        source (str): путь до картинки рецепта, из которой сделана копия.
+    """
+
+    CARD = 'card'
+    DETAIL = 'detail'
+    RETINA = 'retina'
+    NAME_CHOICES = [
+        (CARD, 'Карточка'),
+        (DETAIL, 'Страница рецепта'),
+        (RETINA, 'Retina'),
+    ]
+    JPEG = 'jpeg'
+    WEBP = 'webp'
+    FORMAT_CHOICES = [
+        (JPEG, 'JPEG'),
+        (WEBP, 'WebP'),
+    ]
+
+    recipe = models.ForeignKey(
+        'Recipe',
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+        verbose_name='Рецепт'
+    )
+    name = models.CharField('Размер', max_length=10, choices=NAME_CHOICES)
+    format = models.CharField('Формат', max_length=10, choices=FORMAT_CHOICES)
+    image = models.ImageField('Картинка', upload_to='recipes/variants/')
+    width = models.PositiveSmallIntegerField('Ширина')
+    height = models.PositiveSmallIntegerField('Высота')
+    source = models.CharField('Исходная картинка', max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'name', 'format'),
+                name='recipe_image_variant_unique'
+            ),
+        ]
+        ordering = ('width',)
+        verbose_name = 'Копия картинки рецепта'
+        verbose_name_plural = 'Копии картинок рецептов'
+
+    def __str__(self):
+        """Возвращает строковое представление модели"""
+
+        return f'{self.recipe}: {self.name} {self.format}'
+
 
 class ShoppingCart(models.Model):
     """Модель для списка покупок.
@@ -238,3 +443,82 @@ class Favorite(models.Model):
         ]
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+
+
+class ShoppingListItem(models.Model):
+    """Модель для сводного списка покупок пользователя.
+
+    Хранит суммарное количество каждого ингредиента по всем рецептам из
+    списка покупок пользователя и обновляется при добавлении/удалении
+    рецептов и при изменении их ингредиентов.
+
+    Attributes:
+        user (int): id пользователя.
+        ingredient (int): id ингредиента.
+        total_amount (int): суммарное количество ингредиента.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField('Количество', default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='shopping_list_item_unique'
+            ),
+        ]
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+
+    def __str__(self):
+        """Возвращает строковое представление модели"""
+
+        return (f'{self.ingredient.name}: {self.total_amount},'
+                f' {self.ingredient.measurement_unit}')
+
+    @classmethod
+    def change_amounts(cls, user_ids, amounts):
+        """Изменяет сводные списки покупок пользователей.
+
+        Args:
+            user_ids (list): список id пользователей.
+            amounts (dict): словарь {id ингредиента: на сколько изменить
+            количество}, отрицательные значения уменьшают количество.
+        """
+
+        amounts = {
+            ingredient_id: amount for ingredient_id, amount in amounts.items()
+            if amount
+        }
+        user_ids = list(user_ids)
+        if not user_ids or not amounts:
+            return
+        cls.objects.bulk_create(
+            (
+                cls(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids
+                for ingredient_id, amount in amounts.items() if amount > 0
+            ),
+            ignore_conflicts=True
+        )
+        items = cls.objects.filter(user__in=user_ids, ingredient__in=amounts)
+        items.update(total_amount=Greatest(F('total_amount') + Case(
+            *(
+                When(ingredient_id=ingredient_id, then=Value(amount))
+                for ingredient_id, amount in amounts.items()
+            ),
+            output_field=IntegerField()
+        ), 0))
+        items.filter(total_amount__lte=0).delete()
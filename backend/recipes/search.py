@@ -0,0 +1,243 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, FloatField, Q, Value
+
+from .models import Ingredient, Recipe, RecipeIngredient
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса полей: название важнее ингредиентов, ингредиенты важнее текста.
+# Порядок совпадает с порядком столбцов таблицы FTS_TABLE.
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+# Сколько рецептов индексируется одним запросом.
+SEARCH_INDEX_BATCH_SIZE = 500
+# Столбец search_vector пачки рецептов заполняется одним UPDATE: названия
+# ингредиентов собираются подзапросом, веса те же, что у SearchVector
+# (название 'A', ингредиенты 'B', текст 'C').
+UPDATE_SEARCH_VECTORS_SQL = (
+    f'UPDATE {Recipe._meta.db_table} SET search_vector = '
+    "setweight(to_tsvector(%s::regconfig, "
+    f"COALESCE({Recipe._meta.db_table}.name, '')), 'A') || "
+    "setweight(to_tsvector(%s::regconfig, "
+    "COALESCE(ingredients.names, '')), 'B') || "
+    "setweight(to_tsvector(%s::regconfig, "
+    f"COALESCE({Recipe._meta.db_table}.text, '')), 'C') "
+    "FROM (SELECT recipe.id, string_agg(ingredient.name, ' ') AS names "
+    f'FROM {Recipe._meta.db_table} recipe '
+    f'LEFT JOIN {RecipeIngredient._meta.db_table} recipe_ingredient '
+    'ON recipe_ingredient.recipe_id = recipe.id '
+    f'LEFT JOIN {Ingredient._meta.db_table} ingredient '
+    'ON ingredient.id = recipe_ingredient.ingredient_id '
+    'WHERE recipe.id = ANY(%s) GROUP BY recipe.id) ingredients '
+    f'WHERE {Recipe._meta.db_table}.id = ingredients.id'
+)
+# Переиндексация рецептов после переименования ингредиента выполняется в
+# одном фоновом потоке.
+executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix='recipe-search'
+)
+
+
+def fold(text):
+    """Приводит 'ё' к 'е' (токенизатор FTS5 их не различает)."""
+
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def get_fts_query(query):
+    """Возвращает запрос в синтаксисе FTS5.
+
+    Каждое слово берется в кавычки (операторы FTS5 в запросе пользователя
+    не работают), последнее слово ищется по префиксу.
+
+    Args:
+        query (str): поисковый запрос пользователя.
+
+    Returns:
+        str: запрос для MATCH.
+    """
+
+    words = ['"{}"'.format(word.replace('"', '""'))
+             for word in fold(query).split()]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+def get_tsquery(query):
+    """Возвращает запрос в синтаксисе to_tsquery PostgreSQL.
+
+    Слова запроса объединяются через '&', последнее слово ищется по
+    префиксу (':*'), как в get_fts_query.
+
+    Args:
+        query (str): поисковый запрос пользователя.
+
+    Returns:
+        str: запрос для to_tsquery.
+    """
+
+    words = ["'{}'".format(word.replace('\\', '\\\\').replace("'", "''"))
+             for word in query.split()]
+    if words:
+        words[-1] += ':*'
+    return ' & '.join(words)
+
+
+def update_search_index(recipe_ids):
+    """Обновляет поисковый индекс рецептов пачками по
+    SEARCH_INDEX_BATCH_SIZE.
+
+    На PostgreSQL заполняет столбец search_vector (индекс GIN) одним
+    запросом UPDATE на пачку, на SQLite - таблицу FTS5 FTS_TABLE.
+    Вызывается после изменения рецепта и его ингредиентов.
+
+    Args:
+        recipe_ids (list): список id рецептов.
+    """
+
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), SEARCH_INDEX_BATCH_SIZE):
+        batch = recipe_ids[start:start + SEARCH_INDEX_BATCH_SIZE]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    UPDATE_SEARCH_VECTORS_SQL, (SEARCH_CONFIG,) * 3 + (batch,)
+                )
+        else:
+            update_fts_index(batch)
+
+
+def update_fts_index(recipe_ids):
+    """Перезаписывает рецепты в таблице FTS5 (только для SQLite).
+
+    Args:
+        recipe_ids (list): список id рецептов.
+    """
+
+    ingredients = defaultdict(list)
+    for recipe_id, name in RecipeIngredient.objects.filter(
+        recipe__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient__name'):
+        ingredients[recipe_id].append(name)
+    recipes = [
+        (pk, name, ' '.join(ingredients[pk]), text)
+        for pk, name, text in Recipe.objects.filter(
+            id__in=recipe_ids
+        ).values_list('id', 'name', 'text')
+    ]
+    # Одна транзакция на пачку: в режиме autocommit SQLite фиксирует
+    # каждую строку отдельно.
+    with transaction.atomic(), connection.cursor() as cursor:
+        delete_search_index(recipe_ids)
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, ingredients, text) '
+            'VALUES (%s, %s, %s, %s)',
+            [(pk, *map(fold, fields)) for pk, *fields in recipes]
+        )
+
+
+def update_ingredient_search_index(ingredient_id):
+    """Переиндексирует рецепты с ингредиентом в потоке executor.
+
+    Args:
+        ingredient_id (int): id ингредиента.
+    """
+
+    close_old_connections()
+    try:
+        update_search_index(RecipeIngredient.objects.filter(
+            ingredient_id=ingredient_id
+        ).values_list('recipe_id', flat=True).distinct())
+    except Exception:
+        logger.exception(
+            'Search index of ingredient %s recipes failed', ingredient_id
+        )
+    finally:
+        close_old_connections()
+
+
+def schedule_ingredient_search_index(ingredient_id):
+    """Ставит в очередь переиндексацию рецептов с ингредиентом.
+
+    Рецептов с популярным ингредиентом может быть очень много, поэтому
+    они переиндексируются в фоновом потоке после фиксации транзакции, и
+    запрос на переименование ингредиента их не ждет.
+
+    Args:
+        ingredient_id (int): id ингредиента.
+    """
+
+    transaction.on_commit(
+        lambda: executor.submit(update_ingredient_search_index, ingredient_id)
+    )
+
+
+def delete_search_index(recipe_ids):
+    """Удаляет рецепты из таблицы FTS5 (только для SQLite).
+
+    Args:
+        recipe_ids (list): список id рецептов.
+    """
+
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(pk,) for pk in recipe_ids]
+        )
+
+
+def search_recipes(queryset, query):
+    """Фильтрует рецепты по поисковому запросу.
+
+    Ищет по названию, тексту и названиям ингредиентов, последнее слово
+    запроса - по префиксу. Каждый найденный рецепт получает аннотацию rank:
+    чем она больше, тем лучше рецепт соответствует запросу.
+
+    Args:
+        queryset (QuerySet): список рецептов.
+        query (str): поисковый запрос.
+
+    Returns:
+        QuerySet: найденные рецепты с аннотацией rank.
+    """
+
+    if connection.vendor == 'postgresql':
+        tsquery = get_tsquery(query)
+        if not tsquery:
+            return queryset.none()
+        search_query = SearchQuery(
+            tsquery, config=SEARCH_CONFIG, search_type='raw'
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        )
+    if connection.vendor == 'sqlite':
+        fts_query = get_fts_query(query)
+        if not fts_query:
+            return queryset.none()
+        # Таблица FTS5 присоединяется к рецептам один раз: bm25() считается
+        # для строк, найденных MATCH, а не подзапросом для каждого рецепта.
+        return queryset.extra(
+            select={'rank': f'-bm25({FTS_TABLE}, %s, %s, %s)'},
+            select_params=FTS_WEIGHTS,
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {Recipe._meta.db_table}.id',
+                   f'{FTS_TABLE} MATCH %s'],
+            params=(fts_query,)
+        )
+    return queryset.filter(
+        Q(name__icontains=query)
+        | Q(text__icontains=query)
+        | Q(ingredients__name__icontains=query)
+    ).distinct().annotate(rank=Value(0.0, output_field=FloatField()))
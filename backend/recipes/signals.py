@@ -0,0 +1,245 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from users.models import User
+
+from .catalogue import INGREDIENTS, RECIPES, TAGS, bump_catalogue_version
+from .images import schedule_image_variants
+from .models import (Favorite, Ingredient, Recipe, RecipeImageVariant,
+                     ShoppingCart, ShoppingListItem, Tag, get_tag_bit)
+from .search import delete_search_index, schedule_ingredient_search_index
+
+COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'cart_count',
+}
+
+
+def change_counter(model, pk, field, delta):
+    """Изменяет счетчик одним запросом UPDATE с выражением F().
+
+    Счетчик не уменьшается ниже нуля.
+
+    Args:
+        model (Model): класс модели со счетчиком.
+        pk (int): id объекта.
+        field (str): название поля счетчика.
+        delta (int): на сколько изменить счетчик.
+    """
+
+    objects = model.objects.filter(pk=pk)
+    if delta < 0:
+        objects = objects.filter(**{f'{field}__gte': -delta})
+    objects.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increase_recipe_counter(sender, instance, created, **kwargs):
+    """Увеличивает счетчик рецепта при добавлении в избранное/список
+    покупок.
+    """
+
+    if created:
+        change_counter(Recipe, instance.recipe_id, COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrease_recipe_counter(sender, instance, **kwargs):
+    """Уменьшает счетчик рецепта при удалении из избранного/списка покупок,
+    в том числе при удалении через QuerySet.delete() и каскадном удалении.
+    """
+
+    change_counter(Recipe, instance.recipe_id, COUNTERS[sender], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, **kwargs):
+    """Увеличивает счетчик рецептов автора при создании рецепта."""
+
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def move_recipes_count(sender, instance, update_fields, **kwargs):
+    """Переносит рецепт в счетчике рецептов при смене его автора.
+
+    Прежний автор запоминается при загрузке рецепта (Recipe.from_db).
+    """
+
+    if update_fields is not None and 'author' not in update_fields:
+        return
+    loaded_author_id = getattr(instance, '_loaded_author_id', None)
+    if loaded_author_id not in (None, instance.author_id):
+        change_counter(User, loaded_author_id, 'recipes_count', -1)
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+    instance._loaded_author_id = instance.author_id
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(sender, instance, **kwargs):
+    """Уменьшает счетчик рецептов автора при удалении рецепта."""
+
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    """Добавляет ингредиенты рецепта в сводный список покупок."""
+
+    if created:
+        ShoppingListItem.change_amounts(
+            [instance.user_id], instance.recipe.get_ingredient_amounts()
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    """Вычитает ингредиенты рецепта из сводного списка покупок.
+
+    Используется pre_delete: при каскадном удалении рецепта его строки
+    RecipeIngredient к этому моменту еще не удалены.
+    """
+
+    ShoppingListItem.change_amounts(
+        [instance.user_id],
+        {
+            ingredient_id: -amount for ingredient_id, amount
+            in instance.recipe.get_ingredient_amounts().items()
+        }
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_variants(sender, instance, update_fields, **kwargs):
+    """Ставит в очередь создание копий картинки рецепта, если картинка
+    изменилась.
+
+    Прежняя картинка запоминается при загрузке рецепта (Recipe.from_db).
+    """
+
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if instance.image and instance.image.name != getattr(
+        instance, '_loaded_image', None
+    ):
+        schedule_image_variants(instance.id)
+    instance._loaded_image = instance.image.name
+
+
+@receiver(post_delete, sender=RecipeImageVariant)
+def delete_image_variant_file(sender, instance, **kwargs):
+    """Удаляет файл копии картинки после удаления записи."""
+
+    storage, name = instance.image.storage, instance.image.name
+    transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_search_index(sender, instance, **kwargs):
+    """Удаляет рецепт из поискового индекса."""
+
+    delete_search_index([instance.id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_index(sender, instance, created,
+                                           **kwargs):
+    """Ставит в очередь обновление поискового индекса рецептов с
+    переименованным ингредиентом.
+    """
+
+    if not created:
+        schedule_ingredient_search_index(instance.id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def change_ingredients_version(sender, **kwargs):
+    """Меняет версию справочника ингредиентов при его изменении."""
+
+    bump_catalogue_version(INGREDIENTS)
+
+
+def remove_tag_bit(tag):
+    """Снимает бит тега в масках тегов его рецептов.
+
+    Args:
+        tag (Tag): объект тега.
+    """
+
+    bit = get_tag_bit(tag.id)
+    if bit:
+        Recipe.objects.filter(tags=tag).update(
+            tags_mask=F('tags_mask').bitand(~bit)
+        )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tags_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    """Обновляет маску тегов рецепта при изменении его тегов.
+
+    Срабатывает и при изменении тегов через сериализатор, и в админке.
+    """
+
+    if reverse and action == 'pre_clear':
+        remove_tag_bit(instance)
+    elif action in ('post_add', 'post_remove'):
+        Recipe.update_tags_masks(pk_set if reverse else [instance.id])
+    elif action == 'post_clear' and not reverse:
+        Recipe.update_tags_masks([instance.id])
+
+
+@receiver(pre_delete, sender=Tag)
+def remove_deleted_tag_bit(sender, instance, **kwargs):
+    """Снимает бит удаляемого тега в масках рецептов.
+
+    При каскадном удалении связей сигнал m2m_changed не отправляется.
+    """
+
+    remove_tag_bit(instance)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def change_tags_version(sender, **kwargs):
+    """Меняет версию справочника тегов при его изменении."""
+
+    bump_catalogue_version(TAGS)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def change_recipes_version(sender, **kwargs):
+    """Меняет поколение данных рецептов: закэшированные ответы со списком и
+    страницами рецептов перестают использоваться.
+
+    Ингредиенты рецепта меняются только вместе с самим рецептом, копии
+    картинки - в save_variants, поэтому сигналы RecipeIngredient и
+    RecipeImageVariant здесь не нужны (и не мешают их массовому удалению).
+    """
+
+    bump_catalogue_version(RECIPES)
+
+
+@receiver(post_save, sender=User)
+def change_authors_version(sender, instance, update_fields, **kwargs):
+    """Меняет поколение данных рецептов при изменении их автора.
+
+    Вход пользователя (обновление только last_login) и сохранение
+    пользователя без рецептов ответы с рецептами не меняют.
+    """
+
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    if instance.recipes_count:
+        bump_catalogue_version(RECIPES)
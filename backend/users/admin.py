@@ -10,6 +10,7 @@ class UserAdmin(admin.ModelAdmin):
     )
     search_fields = ('username',)
     list_filter = ('email', 'username')
+    readonly_fields = ('recipes_count',)
 
 
 @admin.register(Subscribe)
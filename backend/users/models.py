@@ -15,6 +15,7 @@ class User(AbstractUser):
         email (str): электронная почта.
         first_name (str): имя.
         last_name (str): фамилия.
+        recipes_count (int): количество рецептов пользователя.
     """
 
     USERNAME_FIELD = 'email'
@@ -40,6 +41,11 @@ class User(AbstractUser):
     last_name = models.CharField(
         'Фамилия', max_length=150, help_text='Введите фамилию'
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False
+    )
+
+    DENORMALIZED_FIELDS = ('recipes_count',)
 
     class Meta:
         ordering = ('id',)
@@ -51,6 +57,23 @@ class User(AbstractUser):
 
         return self.username
 
+    def save(self, *args, **kwargs):
+        """Сохраняет пользователя.
+
+        При изменении пользователя не перезаписывает поля
+        DENORMALIZED_FIELDS: их меняют сигналы запросами с F(), а значение в
+        объекте может быть устаревшим (например, у пользователя из кэша
+        токенов).
+        """
+
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DENORMALIZED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
 class Subscribe(models.Model):
     """Модель для хранения подписок.
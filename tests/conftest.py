@@ -0,0 +1,12 @@
+import pytest
+from users.models import User
+
+
+@pytest.fixture
+def user():
+    """Возвращает пользователя без рецептов."""
+
+    return User.objects.create_user(
+        username='test_user', email='test_user@example.com',
+        first_name='Тест', last_name='Пользователь', password='test-password'
+    )
@@ -0,0 +1,21 @@
+import pytest
+from recipes.models import Recipe
+from users.models import User
+
+
+@pytest.mark.django_db
+def test_stale_user_save_keeps_recipes_count(user):
+    """Сохранение устаревшего объекта пользователя (например, из кэша
+    токенов) не затирает счетчик рецептов, измененный сигналом.
+    """
+
+    stale_user = User.objects.get(pk=user.pk)
+    Recipe.objects.create(
+        author=user, name='Борщ', text='Рецепт', image='recipes/test.jpg',
+        cooking_time=10
+    )
+    stale_user.first_name = 'Новое имя'
+    stale_user.save()
+    user.refresh_from_db()
+    assert user.recipes_count == 1
+    assert user.first_name == 'Новое имя'
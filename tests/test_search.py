@@ -0,0 +1,53 @@
+from importlib import import_module
+
+import pytest
+from django.db import connection
+from recipes.models import Recipe
+from recipes.search import search_recipes, update_search_index
+
+FTS_MIGRATION = 'recipes.migrations.0018_recipe_search_vector'
+
+
+@pytest.fixture
+def recipes(user):
+    """Создает проиндексированные рецепты.
+
+    Тестовая база создается без миграций, поэтому на SQLite таблица FTS5
+    создается так же, как в миграции 0018.
+    """
+
+    if connection.vendor == 'sqlite':
+        migration = import_module(FTS_MIGRATION)
+        with connection.cursor() as cursor:
+            for statement in migration.SQLITE_FORWARD:
+                cursor.execute(statement)
+    recipes = [
+        Recipe.objects.create(
+            author=user, name=name, text=text, image='recipes/test.jpg',
+            cooking_time=10
+        )
+        for name, text in (
+            ('Борщ', 'Свекла и капуста'),
+            ('Щи', 'Капуста и морковь'),
+            ('Блины', 'Мука и молоко'),
+        )
+    ]
+    update_search_index(recipe.id for recipe in recipes)
+    return recipes
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('query, names', (
+    ('бор', {'Борщ'}),
+    ('капуста', {'Борщ', 'Щи'}),
+    ('капуста мор', {'Щи'}),
+    ('молоко бл', {'Блины'}),
+    ('мор капуста', set()),
+))
+def test_search_prefix(recipes, query, names):
+    """На PostgreSQL и SQLite последнее слово запроса ищется по префиксу,
+    остальные слова - целиком.
+    """
+
+    found = search_recipes(Recipe.objects.all(), query)
+    assert {recipe.name for recipe in found} == names